@@ -3,20 +3,42 @@
 
 import argparse
 import bz2
+import collections
 import configparser
 import concurrent.futures
+import ctypes
+import functools
+import gzip
+import hashlib
+import io
 import logging
 import lzma
+import math
+import multiprocessing
 import os
+import platform
+import queue
 import re
 import shutil
+import sqlite3
+import struct
 import sys
+import tarfile
+import tempfile
+import threading
 import time
 import zipfile
-from concurrent.futures import ThreadPoolExecutor
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import BinaryIO, Callable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+try:
+    # Python 3.14+ 标准库提供 zstd
+    from compression import zstd
+except ImportError:
+    zstd = None
 
 # 硬编码参数
 CONFIG_FILE = "config.ini"
@@ -25,11 +47,93 @@ LOG_DATE_FORMAT = "%H:%M:%S"
 LOG_FILE_FORMAT = "%(asctime)s.%(msecs)03d | %(levelname)s | %(message)s"
 DEFAULT_COMPRESSION_ALGORITHM = "bzip2"
 DEFAULT_ARCHIVE_MODE = "overwrite"
+DEFAULT_EXECUTOR = "thread"
+DEFAULT_ENTRY_FORMAT = "stored"
+DEFAULT_ARCHIVE_FORMAT = "zip"
 LZMA_PRESET = 9
 LZMA_DICT_SIZE = 32 * 1024 * 1024
+LZMA_BLOCK_SIZE = 8 * 1024 * 1024
+LZMA_MIN_DICT_SIZE = 4096
+XZ_HEADER_MAGIC = b"\xfd7zXZ\x00"
+XZ_FOOTER_MAGIC = b"YZ"
+ZIP_LZMA_VERSION = (9, 4)
+ZIP_LZMA_EOS_FLAG = 0x02
+ZIP_END_RECORD = struct.Struct("<4s4H2LH")
+ZIP64_END_RECORD = struct.Struct("<4sQ2H2L4Q")
+ZIP64_END_LOCATOR = struct.Struct("<4sLQL")
+ZIP_MAX_COMMENT = 65535
+INDEX_SUFFIX = ".index.db"
+CATALOG_SUFFIX = ".catalog.db"
+CONTENT_STORE_SUFFIX = ".content.db"
+VERSION_SEPARATOR = ";"
+DEFAULT_DUPLICATE_POLICY = "version"
+CONTENT_REFERENCE = "ref"
+DELTA_PREFIX = "delta:"
+# 未记录压缩算法的 stored 条目按数据开头识别
+COMPRESSED_MAGIC = {b"\xfd7zXZ\x00": "lzma", b"BZh": "bzip2", b"\x28\xb5\x2f\xfd": "zstd"}
+SHARD_PERIODS = {"none": 0, "yearly": 4, "monthly": 7}
+# 规划分片时估算的压缩后大小与原始大小之比（日志文本通常在 10%～20% 之间，估算偏大时分片略小于上限）
+SHARD_SIZE_RATIO = 0.25
+SOLID_EXTENSIONS = {
+    "bzip2": ".tar.bz2",
+    "lzma": ".tar.xz",
+    "zstd": ".tar.zst",
+    "deflate": ".tar.gz"
+}
+SOLID_DATE_PATTERN = re.compile(r"^(\d{4}-\d{2}-\d{2})_(.*)$")
+NATIVE_COMPRESS_TYPES = {
+    "bzip2": zipfile.ZIP_BZIP2,
+    "lzma": zipfile.ZIP_LZMA,
+    "zstd": getattr(zipfile, "ZIP_ZSTANDARD", 93),
+    "deflate": zipfile.ZIP_DEFLATED
+}
 BZIP2_COMPRESSLEVEL = 9
+ZSTD_MAX_LEVEL = 22
+DEFLATE_BLOCK_SIZE = 128 * 1024
+DEFLATE_DICT_SIZE = 32 * 1024
+DOWNGRADE_SPEEDUP = 2
+ENTROPY_SAMPLE_SIZE = 256 * 1024
+ENTROPY_THRESHOLD = 7.9
+# 各压缩算法在各等级区间（上限等级）每字节的相对耗时，用于估算任务成本
+COST_FACTORS = {
+    "deflate": [(3, 0.5), (6, 1.0), (9, 2.0)],
+    "zstd": [(3, 0.3), (9, 1.0), (15, 3.0), (19, 8.0), (22, 12.0)],
+    "bzip2": [(9, 3.0)],
+    "lzma": [(3, 2.0), (6, 6.0), (9, 8.0)],
+    "auto": [(ZSTD_MAX_LEVEL, 6.0)]
+}
+AUTO_SAMPLE_SLICES = 3
+AUTO_SAMPLE_SLICE_SIZE = 64 * 1024
+AUTO_TOLERANCE = 5
+AUTO_CANDIDATES = [("deflate", 6), ("bzip2", 1), ("bzip2", 9), ("lzma", 6), ("lzma", 9)]
+if zstd is not None:
+    AUTO_CANDIDATES += [("zstd", 3), ("zstd", 19)]
+BZIP2_BLOCK_UNIT = 100 * 1000
+PARALLEL_THRESHOLD = 16 * 1024 * 1024
+SMALL_FILE_THRESHOLD = 64 * 1024
+SMALL_BATCH_FILES = 64
 CHUNK_SIZE = 8192
+SPOOL_MAX_SIZE = 1024 * 1024
+WRITER_QUEUE_SIZE = 4
+IN_FLIGHT_FACTOR = 2
+# 压缩器内存占用估算：lzma 编码器约为字典大小的倍数（等级 0-3 使用 hc4 匹配器，4-9 使用 bt4 匹配器）
+LZMA_MEMORY_FACTORS = (7.5, 11.5)
+# zstd 各等级区间（上限等级）的压缩上下文大小估算
+ZSTD_MEMORY_ESTIMATES = [(3, 4 * 1024 * 1024), (9, 16 * 1024 * 1024), (15, 48 * 1024 * 1024), (19, 128 * 1024 * 1024), (22, 768 * 1024 * 1024)]
+DEFLATE_MEMORY = 384 * 1024
 MAX_WORKERS = 1
+BACKGROUND_NICE = 10
+LOAD_SAMPLE_INTERVAL = 1.0
+LOAD_HYSTERESIS = 10
+LOAD_MAX_PAUSE = 300
+# I/O 优先级：best-effort 类（2）中的最低级别（7）
+IOPRIO_CLASS_BE = 2
+IOPRIO_LOWEST_LEVEL = 7
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_SET_SYSCALLS = {"x86_64": 251, "amd64": 251, "aarch64": 30, "arm64": 30}
+WINDOWS_BELOW_NORMAL_PRIORITY_CLASS = 0x00004000
+WINDOWS_PROCESS_MODE_BACKGROUND_BEGIN = 0x00100000
 PROGRESS_UPDATE_INTERVAL = 1
 VERSION = "v2.1.5"
 
@@ -158,22 +262,112 @@ archive_name_format = "存档"
 # 压缩算法：支持的压缩算法
 # bzip2：压缩速度较快，压缩率适中
 # lzma：压缩率较高，压缩速度较慢
+# zstd：压缩和解压速度都很快，压缩率接近 lzma（需要 Python 3.14+）
+# deflate：速度最快，压缩率最低，始终写入标准 ZIP 压缩条目
+# auto：对每个文件抽样试压缩，自动选择压缩算法和压缩等级（忽略 compression_level）
 compression_algorithm = bzip2
 
-# 压缩等级：压缩算法的压缩等级（1-9）
+# 自动选择的压缩率容差（百分比）：auto 模式下，在样本压缩后大小不超过最优结果该比例的候选中选择最快的
+auto_tolerance = 5
+
+# 压缩等级：压缩算法的压缩等级（bzip2 / lzma / deflate 为 1-9，zstd 为 1-22）
 compression_level = 9
 
+# 归档格式
+# zip：每个文件单独压缩后保存到 ZIP 文件中
+# solid：所有文件写入一个 tar 包并整体压缩（.tar.xz / .tar.bz2），同日不同配置的日志共享字典，压缩率更高
+#        固实归档无法追加，增量模式下也按滚动模式创建新文件，且不使用多线程
+archive_format = zip
+
+# 归档条目格式
+# stored：压缩数据以存储模式保存在原文件名下，需要先按压缩算法解压（兼容旧版本归档）
+# native：写入标准的 BZIP2 / LZMA 压缩条目，可直接使用常见解压工具读取（不使用分块并行压缩）
+# deflate 算法不受此项影响，始终写入标准的 DEFLATE 压缩条目
+entry_format = stored
+
 # 归档模式：控制归档文件的创建方式
 # scroll：滚动模式，当日多次运行时创建新归档文件
 # incremental：增量模式，将文件追加到同一 ZIP 文件中
 archive_mode = scroll
 
-# 最大工作线程数：压缩文件时使用的线程数
+# 重复文件处理方式（增量模式下归档中已存在同名文件时）
+# version：作为新版本写入同一归档，条目名为 文件名;2、文件名;3 ...，最新版本为序号最大的条目
+# archive：写入单独的重复文件归档（重复文件_<归档文件名>_<时间>.zip）
+duplicate_policy = version
+
+# 内容去重：增量模式下文件内容与已归档条目（包括其他分片中的条目）完全相同时不再压缩存储
+# 内容哈希记录在归档文件夹中的 <归档文件名>.content.db，各分片共用，重建归档索引时不受影响
+# 同名文件直接跳过，不同名文件写入只记录目标条目名的引用条目（引用条目需要使用 -x 参数解压）
+content_dedup = false
+
+# 追加增量：增量模式下（需启用 archive_index，duplicate_policy 为 version）文件开头与归档中最新版本完全相同时，
+# 只压缩追加的部分，写入引用该版本的增量条目（增量条目需要使用 -x 参数解压，其他解压软件只能得到追加的部分）
+append_delta = false
+
+# 归档索引：增量模式下在归档文件旁维护 SQLite 索引（归档文件名 + .index.db），记录条目名称、偏移、大小和 SHA-256，
+# 查重时不再读取整个归档，追加时原样复制旧中央目录而不逐条解析；索引与归档不一致时自动重建
+archive_index = true
+
+# 分片（仅增量模式）：归档文件过大时自动切换到新的分片，分片与日志日期的对应关系记录在 <归档文件名>.catalog.db 中
+# shard_period：按日志日期分片，none 不按日期，monthly 每月一个分片（存档_2026-10.zip），yearly 每年一个分片（存档_2026.zip）
+# shard_max_size：当前分片超过该大小（MB）后，新文件写入下一个分片（存档_2.zip、存档_2026-10_2.zip），0 表示不限制
+# shard_max_entries：当前分片的条目数达到该值后，新文件写入下一个分片，0 表示不限制
+shard_period = none
+shard_max_size = 0
+shard_max_entries = 0
+
+# 最大工作线程数：压缩文件时使用的线程（或进程）数
 max_workers = 1
 
+# 压缩执行方式
+# thread：多线程压缩
+# process：多进程压缩，压缩结果通过临时文件交给写入线程，适合多核机器
+executor = thread
+
+# 后台模式：降低进程的 CPU 优先级（nice +10）和 I/O 优先级，减少对同机运行的 ALAS 的影响
+# Windows 下使用后台处理模式（PROCESS_MODE_BACKGROUND_BEGIN）
+background = false
+
+# CPU 亲和性：将压缩进程绑定到指定的 CPU 核心，如 2,3 或 2-3，留空表示不限制
+# 最大工作线程数不会超过绑定的核心数
+cpu_affinity = 
+
+# 负载上限（百分比）：压缩过程中每秒采样 /proc/stat 中可用核心的 CPU 使用率和 /proc/loadavg，
+# 超出上限时逐步减少并发压缩任务数，仍然超出时暂停提交新任务（最多 300 秒），负载回落后逐步恢复
+# 0 表示不限制；仅支持 Linux
+load_ceiling = 0
+
+# 最大在途任务数：同时提交到线程池的压缩任务上限，0 表示自动（最大工作线程数的 2 倍）
+max_in_flight = 0
+
 # 读取块大小：文件读写时的块大小（字节）
 chunk_size = 8192
 
+# 直接存储不可压缩文件：根据文件开头的字节分布估算熵，接近随机数据（如 PNG、ZIP 等已压缩文件）时不再压缩，原样存储
+store_incompressible = true
+
+# 时间预算（秒）：根据已完成文件的吞吐量估算剩余耗时，预计超时时为剩余文件逐级降低压缩等级或切换为更快的压缩算法
+# 0 表示不限制；固实归档不支持
+time_budget_seconds = 0
+
+# 分块并行压缩阈值：不小于该大小（字节）的单个文件拆分为多个块并行压缩，0 表示禁用
+# 块数量按最大工作线程数并行，bzip2 按压缩等级对齐到 100 KB 的整数倍（等级 9 为 900 KB）
+# lzma 拆分为 8 MB 的 xz 块，输出为带完整索引的单个多块 xz 流
+# deflate 拆分为 128 KB 的块（与 pigz 相同），拼接为单个 deflate 数据流
+parallel_threshold = 16777216
+
+# 小文件合并阈值：小于该大小（字节）的文件合并为批量任务，由同一个工作线程依次压缩，0 表示禁用
+# 每批最多 64 个文件，批次数不少于最大工作线程数
+small_file_threshold = 65536
+
+# 内存上限（MB）：根据压缩算法、等级、字典大小和文件大小估算每个工作线程的内存占用，
+# 估算总量超出上限时自动减少工作线程数，0 表示不限制
+memory_limit = 0
+
+# 页缓存提示（仅支持 posix_fadvise 的系统）：读取日志时提示内核顺序预读，读取和写入完成后将其移出页缓存，
+# 避免归档过程挤占模拟器等同机程序的页缓存；归档文件关闭前会先写回磁盘
+page_cache_hints = true
+
 # 是否保存日志文件：控制是否将程序日志保存到本地文件
 save_logs = true
 
@@ -257,19 +451,58 @@ def load_config(config_path: str) -> dict:
     save_logs_str = get_value("settings", "save_logs", "true").lower()
     save_logs = save_logs_str in ["true", "yes", "1"]
     
+    store_incompressible_str = get_value("settings", "store_incompressible", "true").lower()
+    store_incompressible = store_incompressible_str in ["true", "yes", "1"]
+    
+    page_cache_hints_str = get_value("settings", "page_cache_hints", "true").lower()
+    page_cache_hints = page_cache_hints_str in ["true", "yes", "1"]
+    
+    archive_index_str = get_value("settings", "archive_index", "true").lower()
+    archive_index = archive_index_str in ["true", "yes", "1"]
+    
+    content_dedup_str = get_value("settings", "content_dedup", "false").lower()
+    content_dedup = content_dedup_str in ["true", "yes", "1"]
+    
+    append_delta_str = get_value("settings", "append_delta", "false").lower()
+    append_delta = append_delta_str in ["true", "yes", "1"]
+    
+    background_str = get_value("settings", "background", "false").lower()
+    background = background_str in ["true", "yes", "1"]
+    
     config_dict = {
         "target_folder": get_value("settings", "target_folder"),
         "archive_folder": get_value("settings", "archive_folder"),
         "archive_name_format": get_value("settings", "archive_name_format", "存档"),
         "compression_algorithm": get_value("settings", "compression_algorithm", DEFAULT_COMPRESSION_ALGORITHM).lower(),
         "compression_level": get_int_value("settings", "compression_level", 9),
+        "auto_tolerance": get_int_value("settings", "auto_tolerance", AUTO_TOLERANCE),
+        "archive_format": get_value("settings", "archive_format", DEFAULT_ARCHIVE_FORMAT).lower(),
+        "entry_format": get_value("settings", "entry_format", DEFAULT_ENTRY_FORMAT).lower(),
         "archive_mode": get_value("settings", "archive_mode", "scroll").lower(),
         "log_folder": get_value("settings", "log_folder", "logs"),
         "max_log_files": get_int_value("settings", "max_log_files", 15),
         "log_level": log_level,
         "save_logs": save_logs,
         "max_workers": get_int_value("settings", "max_workers", MAX_WORKERS),
-        "chunk_size": get_int_value("settings", "chunk_size", CHUNK_SIZE)
+        "max_in_flight": get_int_value("settings", "max_in_flight", 0),
+        "executor": get_value("settings", "executor", DEFAULT_EXECUTOR).lower(),
+        "chunk_size": get_int_value("settings", "chunk_size", CHUNK_SIZE),
+        "parallel_threshold": get_int_value("settings", "parallel_threshold", PARALLEL_THRESHOLD),
+        "small_file_threshold": get_int_value("settings", "small_file_threshold", SMALL_FILE_THRESHOLD),
+        "memory_limit": get_int_value("settings", "memory_limit", 0),
+        "page_cache_hints": page_cache_hints,
+        "background": background,
+        "archive_index": archive_index,
+        "content_dedup": content_dedup,
+        "append_delta": append_delta,
+        "duplicate_policy": get_value("settings", "duplicate_policy", DEFAULT_DUPLICATE_POLICY).lower(),
+        "shard_period": get_value("settings", "shard_period", "none").lower(),
+        "shard_max_size": get_int_value("settings", "shard_max_size", 0),
+        "shard_max_entries": get_int_value("settings", "shard_max_entries", 0),
+        "cpu_affinity": get_value("settings", "cpu_affinity", ""),
+        "load_ceiling": get_int_value("settings", "load_ceiling", 0),
+        "time_budget_seconds": get_int_value("settings", "time_budget_seconds", 0),
+        "store_incompressible": store_incompressible
     }
     
     return config_dict
@@ -387,354 +620,2832 @@ def format_size(size_bytes: int) -> str:
     return f"{size_bytes:.2f} PB"
 
 
-def read_file_chunked(file_path: str, chunk_size: int) -> bytes:
-    """分块读取文件内容
+class CompressResult(NamedTuple):
+    """单个文件的压缩结果"""
+    arcname: str
+    compressed_data: Union[BinaryIO, str]
+    original_size: int
+    compressed_size: int
+    crc: int
+    compress_type: int
+    algorithm: str
+    compression_level: int
+    elapsed: float
+    sha256: str
+    delta_base: str = ""
+    delta_offset: int = 0
+    # 压缩用到的各线程 CPU 时间之和，分块并行压缩时可大于 elapsed
+    busy_time: float = 0.0
+
+
+class CompressOptions(NamedTuple):
+    """压缩任务的压缩选项，随任务传给工作线程或进程"""
+    compression_algorithm: str
+    compression_level: int
+    chunk_size: int
+    temp_dir: Optional[str] = None
+    parallel_threshold: int = 0
+    block_workers: int = 1
+    entry_format: str = DEFAULT_ENTRY_FORMAT
+    auto_tolerance: int = AUTO_TOLERANCE
+    store_incompressible: bool = False
+    page_cache_hints: bool = False
+
+
+class ArchiveSettings(NamedTuple):
+    """归档设置，各字段与配置文件中的同名设置对应（memory_limit 和 shard_max_size 为字节数）"""
+    compression_algorithm: str
+    compression_level: int
+    auto_tolerance: int
+    store_incompressible: bool
+    archive_format: str
+    entry_format: str
+    archive_mode: str
+    max_workers: int
+    max_in_flight: int
+    executor_type: str
+    chunk_size: int
+    parallel_threshold: int
+    small_file_threshold: int
+    memory_limit: int
+    page_cache_hints: bool
+    load_ceiling: int
+    archive_index: bool
+    duplicate_policy: str
+    content_dedup: bool
+    append_delta: bool
+    shard_period: str
+    shard_max_size: int
+    shard_max_entries: int
+    time_budget_seconds: int
+
+
+def create_compressor(compression_algorithm: str, compression_level: int, entry_format: str = DEFAULT_ENTRY_FORMAT, zstd_workers: int = 0, dict_size: int = LZMA_DICT_SIZE):
+    """创建流式压缩器
+
+    native 条目格式的 lzma 使用 ZIP 规范要求的原始 LZMA1 数据流，
+    数据头由 build_zip_lzma_header 生成。
 
     Args:
-        file_path: 文件路径
-        chunk_size: 块大小
+        compression_algorithm: 压缩算法
+        compression_level: 压缩等级
+        entry_format: 归档条目格式（stored 或 native）
+        zstd_workers: zstd 内部压缩线程数，0 表示不使用多线程
+        dict_size: lzma 字典大小
 
     Returns:
-        bytes: 文件内容
+        流式压缩器对象（lzma.LZMACompressor、bz2.BZ2Compressor、zlib 压缩对象或 zstd.ZstdCompressor）
     """
-    chunks = []
-    with open(file_path, "rb") as f:
-        while True:
-            chunk = f.read(chunk_size)
-            if not chunk:
-                break
-            chunks.append(chunk)
-    return b"".join(chunks)
+    if compression_algorithm.lower() == "lzma" and entry_format == "native":
+        lzma_filters = [
+            {"id": lzma.FILTER_LZMA1, "preset": compression_level, "dict_size": dict_size}
+        ]
+        return lzma.LZMACompressor(format=lzma.FORMAT_RAW, filters=lzma_filters)
+    elif compression_algorithm.lower() == "lzma":
+        lzma_filters = [
+            {"id": lzma.FILTER_LZMA2, "preset": compression_level, "dict_size": dict_size}
+        ]
+        return lzma.LZMACompressor(filters=lzma_filters)
+    elif compression_algorithm.lower() == "bzip2":
+        return bz2.BZ2Compressor(compression_level)
+    elif compression_algorithm.lower() == "deflate":
+        return zlib.compressobj(compression_level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    elif compression_algorithm.lower() == "zstd" and zstd is not None:
+        if zstd_workers > 1:
+            options = {
+                zstd.CompressionParameter.compression_level: compression_level,
+                zstd.CompressionParameter.nb_workers: zstd_workers
+            }
+            try:
+                return zstd.ZstdCompressor(options=options)
+            except zstd.ZstdError:
+                # libzstd 未启用多线程支持时退回单线程压缩
+                pass
+        return zstd.ZstdCompressor(level=compression_level)
+    else:
+        raise ValueError(f"不支持的压缩算法: {compression_algorithm}")
+
+
+def lzma_dict_size(file_size: int) -> int:
+    """按文件大小选择 LZMA 字典大小：能容纳整个文件的最小 2 的幂，不超过 LZMA_DICT_SIZE
+
+    字典大于输入数据不会提高压缩率，只会增加编码器内存占用和初始化耗时。
+
+    Args:
+        file_size: 文件大小
+
+    Returns:
+        int: 字典大小
+    """
+    return max(LZMA_MIN_DICT_SIZE, min(LZMA_DICT_SIZE, 1 << max(file_size - 1, 0).bit_length()))
+
+
+def build_zip_lzma_header(dict_size: int) -> bytes:
+    """生成 ZIP LZMA 条目的数据头（LZMA SDK 版本号、属性长度和 LZMA1 属性）
+
+    Args:
+        dict_size: 字典大小
+
+    Returns:
+        bytes: 数据头
+    """
+    # 默认参数 lc=3, lp=0, pb=2
+    properties = bytes([(2 * 5 + 0) * 9 + 3]) + struct.pack("<I", dict_size)
+    return struct.pack("<BBH", *ZIP_LZMA_VERSION, len(properties)) + properties
+
+
+def fadvise(fd: int, advice: str) -> None:
+    """使用 posix_fadvise 向内核提示整个文件的访问方式，系统不支持时不做任何操作
+
+    Args:
+        fd: 文件描述符
+        advice: os 模块中的提示常量名，如 POSIX_FADV_SEQUENTIAL
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, getattr(os, advice))
+    except OSError:
+        pass
 
 
-def compress_file(file_path: str, compression_algorithm: str, compression_level: int, chunk_size: int) -> Tuple[str, bytes, int]:
-    """压缩单个文件
+def drop_file_cache(file_path: str, sync: bool = False) -> None:
+    """将文件移出页缓存
+
+    内核不会释放尚未写回的脏页，刚写入的文件需要 sync 为 True，先写回磁盘再释放。
 
     Args:
         file_path: 文件路径
-        compression_algorithm: 压缩算法
-        compression_level: 压缩等级
+        sync: 是否先将文件写回磁盘
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        fd = os.open(file_path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        if sync:
+            os.fsync(fd)
+        fadvise(fd, "POSIX_FADV_DONTNEED")
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def iter_file_chunks(f: BinaryIO, chunk_size: int) -> Iterator[memoryview]:
+    """使用 readinto 将文件依次读入同一个预分配缓冲区，逐块返回缓冲区的 memoryview 切片
+
+    整个文件只分配一次缓冲区，数据直接送入压缩器，没有中间拷贝。
+    每个切片只在下一次迭代前有效，调用方需在此之前用完。
+
+    Args:
+        f: 输入文件
         chunk_size: 块大小
 
-    Returns:
-        Tuple[str, bytes, int]: (文件名, 压缩后的数据, 原始大小)
+    Yields:
+        memoryview: 本次读取的数据
     """
-    data = read_file_chunked(file_path, chunk_size)
-    original_size = len(data)
-    
-    if compression_algorithm.lower() == "lzma":
-        lzma_filters = [
-            {"id": lzma.FILTER_LZMA2, "preset": compression_level, "dict_size": LZMA_DICT_SIZE}
-        ]
-        compressed_data = lzma.compress(data, filters=lzma_filters)
-    elif compression_algorithm.lower() == "bzip2":
-        compressed_data = bz2.compress(data, compresslevel=compression_level)
-    else:
-        raise ValueError(f"不支持的压缩算法: {compression_algorithm}")
-    
-    return (os.path.basename(file_path), compressed_data, original_size)
+    buffer = memoryview(bytearray(chunk_size))
+    while True:
+        size = f.readinto(buffer)
+        if not size:
+            return
+        yield buffer[:size]
 
 
-def create_archive_generic(files: List[str], archive_path: str, compression_algorithm: str, compression_level: int, max_workers: int, chunk_size: int, incremental_mode: bool, logger: logging.Logger) -> None:
-    """使用指定压缩算法创建归档文件
+def compress_blocks_parallel(f: BinaryIO, write_block: Callable, compress_block: Callable, block_size: int, block_workers: int, overlap: int = 0, hasher=None) -> Tuple[int, int, float]:
+    """将文件拆分为定长块并行压缩，按原顺序交给 write_block 写出
+
+    同一时间最多有 2 * block_workers 个块在内存中，块数据使用 readinto 读入预分配的缓冲区，
+    缓冲区在对应块写出后复用。
 
     Args:
-        files: 需要归档的文件路径列表
-        archive_path: 归档文件路径
-        compression_algorithm: 压缩算法（lzma 或 bzip2）
-        compression_level: 压缩等级（1-9）
-        max_workers: 最大工作线程数
-        chunk_size: 读取块大小
-        incremental_mode: 是否为增量模式
-        logger: 日志记录器
+        f: 输入文件
+        write_block: 写出函数，按原顺序接收每个块的压缩结果
+        compress_block: 单块压缩函数，输入原始数据，返回压缩结果；
+            overlap 大于 0 时额外接收前一块末尾 overlap 字节作为预设字典
+        block_size: 块大小
+        block_workers: 并行线程数
+        overlap: 传给下一块的前一块末尾数据长度
+        hasher: 原始数据的哈希对象（可选），按顺序送入每个块
+
+    Returns:
+        Tuple[int, int, float]: (原始数据大小, 原始数据 CRC32, 各分块线程的 CPU 时间之和)
     """
-    total_files = len(files)
-    logger.info(f"开始压缩 {total_files} 个文件，使用 {max_workers} 个线程")
-    
-    start_time = time.time()
-    compressed_results = []
+    original_size = 0
+    crc = 0
+    busy_time = 0.0
+    previous_tail = b""
+    pending = collections.deque()
+    free_buffers = []
     
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {
-            executor.submit(compress_file, file_path, compression_algorithm, compression_level, chunk_size): file_path
-            for file_path in files
-        }
-        
-        completed = 0
-        for future in concurrent.futures.as_completed(futures):
-            file_path = futures[future]
-            
-            try:
-                result = future.result()
-                compressed_results.append(result)
-                logger.debug(f"已压缩文件: {result[0]}")
-            except Exception as e:
-                logger.error(f"压缩文件 {file_path} 失败: {e}")
-            
-            completed += 1
-            
-            progress = (completed / total_files) * 100
-            progress_line = f"\r压缩进度: {progress:.1f}% ({completed}/{total_files})"
-            print(progress_line, end="", flush=True)
-    
-    print("\r" + " " * 80 + "\r", end="", flush=True)
-    
-    original_size = sum(result[2] for result in compressed_results)
-    
-    zip_mode = "a" if incremental_mode and os.path.exists(archive_path) else "w"
-    existing_size = 0
-    files_to_add = []
+    def timed_block(*args) -> Tuple[object, float]:
+        start = time.thread_time()
+        return compress_block(*args), time.thread_time() - start
     
-    if incremental_mode and os.path.exists(archive_path):
-        existing_size = os.path.getsize(archive_path)
-        logger.info(f"现有归档大小: {format_size(existing_size)}")
-        
-        # 检查ZIP文件中已存在的文件
-        existing_files = set()
-        try:
-            with zipfile.ZipFile(archive_path, "r") as zipf:
-                for info in zipf.infolist():
-                    # 只处理文件，跳过目录
-                    if not info.filename.endswith('/'):
-                        existing_files.add(info.filename)
-        except Exception as e:
-            logger.error(f"读取现有归档文件失败: {e}")
-        
-        # 分离重复文件和新文件
-        new_files = []  # 新文件，使用增量模式
-        duplicate_files = []  # 重复文件，使用滚动模式
-        
-        for arcname, compressed_data, original_size in compressed_results:
-            if arcname in existing_files:
-                # 重复文件，使用滚动模式处理
-                logger.debug(f"重复文件: {arcname}")
-                duplicate_files.append((arcname, compressed_data, original_size))
+    with ThreadPoolExecutor(max_workers=block_workers) as executor:
+        while True:
+            buffer = free_buffers.pop() if free_buffers else memoryview(bytearray(block_size))
+            block = buffer[:f.readinto(buffer)]
+            if block:
+                original_size += len(block)
+                crc = zlib.crc32(block, crc)
+                if hasher is not None:
+                    hasher.update(block)
+                if overlap:
+                    pending.append((executor.submit(timed_block, block, previous_tail), buffer))
+                    # 缓冲区之后会被复用，需要拷贝
+                    previous_tail = bytes(block[-overlap:])
+                else:
+                    pending.append((executor.submit(timed_block, block), buffer))
             else:
-                # 新文件，使用增量模式添加
-                new_files.append((arcname, compressed_data, original_size))
-        
-        # 处理新文件（增量模式）
-        files_to_add = new_files
-        
-        # 处理重复文件（滚动模式）
-        if duplicate_files:
-            # 创建新的归档文件名（带日期时间戳）
-            timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-            base_name = os.path.basename(archive_path)
-            if base_name.endswith('.zip'):
-                base_name = base_name[:-4]
-            append_archive_path = os.path.join(os.path.dirname(archive_path), f"重复文件_{base_name}_{timestamp}.zip")
+                free_buffers.append(buffer)
             
-            # 使用滚动模式创建新归档
-            with zipfile.ZipFile(append_archive_path, "w", zipfile.ZIP_STORED) as zipf:
-                for arcname, compressed_data, original_size in duplicate_files:
-                    # 创建ZipInfo对象，设置正确的文件大小
-                    zinfo = zipfile.ZipInfo(arcname, time.localtime()[:6])
-                    zinfo.file_size = original_size
-                    zinfo.compress_size = len(compressed_data)
-                    zinfo.compress_type = zipfile.ZIP_STORED
-                    zipf.writestr(zinfo, compressed_data)
+            # 窗口已满或输入结束时按顺序写出最早的块
+            while pending and (len(pending) >= block_workers * 2 or not block):
+                future, used_buffer = pending.popleft()
+                compressed, block_time = future.result()
+                write_block(compressed)
+                busy_time += block_time
+                free_buffers.append(used_buffer)
             
-            logger.info(f"{len(duplicate_files)} 个重复文件已保存到新归档文件: {append_archive_path}")
-    else:
-        # 非增量模式或文件不存在，添加所有文件
-        files_to_add = compressed_results
-    
-    # 处理需要添加的文件
-    if files_to_add:
-        # 使用存储模式，因为文件已经被压缩过了
-        with zipfile.ZipFile(archive_path, zip_mode, zipfile.ZIP_STORED) as zipf:
-            # 直接添加新文件（增量模式）
-            for arcname, compressed_data, original_size in files_to_add:
-                # 创建ZipInfo对象，设置正确的文件大小
-                zinfo = zipfile.ZipInfo(arcname, time.localtime()[:6])
-                zinfo.file_size = original_size
-                zinfo.compress_size = len(compressed_data)
-                zinfo.compress_type = zipfile.ZIP_STORED
-                zipf.writestr(zinfo, compressed_data)
-    
-    elapsed_time = time.time() - start_time
-    final_size = os.path.getsize(archive_path)
-    
-    if incremental_mode:
-        # 增量模式：只计算新添加文件的压缩率
-        added_original_size = sum(result[2] for result in files_to_add)
-        added_compressed_size = sum(len(result[1]) for result in files_to_add)
-        compression_ratio = (1 - added_compressed_size / added_original_size) * 100 if added_original_size > 0 else 0
-        
-        if files_to_add:
-            logger.info(f"新增了 {len(files_to_add)} 个文件到增量归档")
-        logger.info(f"已完成归档，压缩耗时: {elapsed_time:.2f}秒，已保存到: {archive_path}")
-        logger.info(f"新增原始大小: {format_size(added_original_size)}，新增压缩大小: {format_size(added_compressed_size)}，压缩率: {compression_ratio:.2f}%")
-        logger.info(f"归档总大小: {format_size(final_size)}（增加了 {format_size(final_size - existing_size)}）")
-    else:
-        # 滚动模式：计算整体压缩率
-        compression_ratio = (1 - final_size / original_size) * 100 if original_size > 0 else 0
-        logger.info(f"已完成归档，压缩耗时: {elapsed_time:.2f}秒，已保存到: {archive_path}")
-        logger.info(f"原始大小: {format_size(original_size)}，压缩后大小: {format_size(final_size)}，压缩率: {compression_ratio:.2f}%")
-    
-    deleted_count = 0
-    for file_path in files:
-        if not os.path.exists(file_path):
-            continue
-        
-        try:
-            os.remove(file_path)
-            logger.debug(f"已删除原始文件: {os.path.basename(file_path)}")
-            deleted_count += 1
-        except Exception as e:
-            logger.error(f"删除文件 {file_path} 失败: {e}")
+            if not block:
+                break
     
-    logger.info(f"共删除 {deleted_count} 个原始文件")
+    return original_size, crc, busy_time
 
 
-def create_archive(files: List[str], archive_folder: str, archive_name_format: str, compression_algorithm: str, compression_level: int, archive_mode: str, max_workers: int, chunk_size: int, logger: logging.Logger) -> None:
-    """创建归档文件
+def compress_deflate_block(data: bytes, dictionary: bytes, compression_level: int) -> bytes:
+    """将一块数据压缩为可拼接的原始 deflate 数据（pigz 方式）
+
+    以前一块末尾 32 KB 作为预设字典，并以 Z_SYNC_FLUSH 结束于字节边界，
+    各块按顺序拼接后再追加一个空的结束块即为完整的 deflate 数据流。
 
     Args:
-        files: 需要归档的文件路径列表
-        archive_folder: 归档文件夹路径
-        archive_name_format: 归档文件名格式（可选包含 {date} 占位符，可选包含 .zip 扩展名）
-        compression_algorithm: 压缩算法（lzma 或 bzip2）
-        compression_level: 压缩等级（1-9）
-        archive_mode: 归档模式（scroll 或 incremental）
-        max_workers: 最大工作线程数
-        chunk_size: 读取块大小
-        logger: 日志记录器
+        data: 原始数据
+        dictionary: 前一块末尾的数据
+        compression_level: 压缩等级
+
+    Returns:
+        bytes: 压缩数据
     """
-    if not files:
-        logger.info("没有文件需要归档")
-        return
-    
-    if not os.path.exists(archive_folder):
-        os.makedirs(archive_folder)
-        logger.info(f"创建归档文件夹: {archive_folder}")
-    
-    archive_date = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
-    incremental_mode = archive_mode == "incremental"
-    
-    # 处理文件名
-    if incremental_mode:
-        # 增量模式：直接使用提供的文件名，不添加日期前缀
-        archive_filename = archive_name_format
-        # 自动添加 .zip 扩展名（如果缺少）
-        if not archive_filename.endswith(".zip"):
-            archive_filename += ".zip"
-        archive_path = os.path.join(archive_folder, archive_filename)
-        
-        if os.path.exists(archive_path):
-            logger.info(f"增量模式：追加到现有归档文件: {archive_filename}")
-        else:
-            logger.info(f"增量模式：创建新归档文件: {archive_filename}")
-    else:  # scroll 模式
-        # 滚动模式：使用年-月-日作为前缀
-        base_name = archive_name_format
-        # 处理扩展名
-        if not base_name.endswith(".zip"):
-            base_name += ".zip"
-        
-        # 检查是否包含 {date} 占位符
-        if "{date}" in base_name:
-            archive_filename = base_name.replace("{date}", archive_date)
-        else:
-            # 如果不包含 {date} 占位符，在文件名前添加日期前缀
-            name_without_ext = base_name.rsplit(".", 1)[0]
-            ext = base_name.rsplit(".", 1)[1]
-            archive_filename = f"{archive_date}_{name_without_ext}.{ext}"
-        
-        archive_path = os.path.join(archive_folder, archive_filename)
-        
-        # 处理文件已存在的情况
-        counter = 0
-        original_filename = archive_filename
-        while os.path.exists(archive_path):
-            counter += 1
-            name_without_ext = original_filename.rsplit(".", 1)[0]
-            ext = original_filename.rsplit(".", 1)[1]
-            archive_filename = f"{name_without_ext}_{counter}.{ext}"
-            archive_path = os.path.join(archive_folder, archive_filename)
-        
-        if counter > 1:
-            logger.info(f"检测到已有归档文件，将创建: {archive_filename}")
-        else:
-            logger.info(f"创建新归档文件: {archive_filename}")
-    
-    logger.info(f"使用压缩算法: {compression_algorithm.upper()}，压缩等级: {compression_level}")
-    
-    try:
-        create_archive_generic(files, archive_path, compression_algorithm, compression_level, max_workers, chunk_size, incremental_mode, logger)
-    except Exception as e:
-        logger.error(f"创建归档文件失败: {e}")
-        raise
+    if dictionary:
+        compressor = zlib.compressobj(compression_level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(compression_level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
 
 
-def validate_compression_level(level: int) -> bool:
-    """验证压缩等级是否有效
+def encode_xz_varint(value: int) -> bytes:
+    """按 xz 格式编码变长整数
 
     Args:
-        level: 压缩等级
+        value: 非负整数
 
     Returns:
-        bool: 是否有效
+        bytes: 编码结果
     """
-    return 1 <= level <= 9
+    encoded = bytearray()
+    while value >= 0x80:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
 
 
-def validate_compression_algorithm(algorithm: str) -> bool:
-    """验证压缩算法是否有效
+def decode_xz_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    """按 xz 格式解码变长整数
 
     Args:
-        algorithm: 压缩算法
+        data: 数据
+        pos: 起始位置
 
     Returns:
-        bool: 是否有效
+        Tuple[int, int]: (整数值, 下一个字节的位置)
     """
-    return algorithm.lower() in ["lzma", "bzip2"]
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
 
 
-def validate_archive_mode(mode: str) -> bool:
-    """验证归档模式是否有效
+def compress_xz_block(data: bytes, filters: list) -> Tuple[bytes, int, int]:
+    """将一块数据压缩为单个 xz 块
+
+    先压缩为只含一个块的完整 xz 流，再从中取出块数据和索引记录，
+    以便多个块拼接到同一个 xz 流中。
 
     Args:
-        mode: 归档模式
+        data: 原始数据
+        filters: lzma 过滤器链
 
     Returns:
-        bool: 是否有效
+        Tuple[bytes, int, int]: (块数据, 未填充大小, 原始大小)
     """
-    return mode.lower() in ["scroll", "incremental"]
+    stream = lzma.compress(data, format=lzma.FORMAT_XZ, check=lzma.CHECK_CRC64, filters=filters)
+    # 流尾部第 4-8 字节为索引大小：(backward_size + 1) * 4
+    index_size = (struct.unpack("<I", stream[-8:-4])[0] + 1) * 4
+    index = stream[-12 - index_size:-12]
+    # 索引结构：指示符(0x00) | 记录数 | 未填充大小 | 原始大小 | ...
+    _, pos = decode_xz_varint(index, 1)
+    unpadded_size, pos = decode_xz_varint(index, pos)
+    uncompressed_size, _ = decode_xz_varint(index, pos)
+    return stream[12:-12 - index_size], unpadded_size, uncompressed_size
 
 
-def parse_command_line_args() -> argparse.Namespace:
-    """解析命令行参数
+def build_xz_stream_header() -> bytes:
+    """生成使用 CRC64 校验的 xz 流头
 
     Returns:
-        argparse.Namespace: 解析后的命令行参数
+        bytes: 流头
     """
-    parser = argparse.ArgumentParser(description="ALAS 日志归档工具")
-    parser.add_argument("-n", "--name", help="归档文件名")
-    parser.add_argument("-t", "--target", help="目标文件夹路径")
-    parser.add_argument("-a", "--archive", help="归档文件夹路径")
-    parser.add_argument("-m", "--mode", help="归档模式", choices=["scroll", "incremental"])
-    parser.add_argument("-c", "--compression", help="压缩算法", choices=["lzma", "bzip2"])
-    parser.add_argument("-l", "--level", help="压缩等级", type=int, choices=range(1, 10), metavar="1-9")
-    parser.add_argument("-w", "--workers", help="多线程设置", type=int)
-    parser.add_argument("-L", "--save-logs", help="日志文件输出控制", choices=["true", "false"])
-    return parser.parse_args()
+    stream_flags = bytes([0x00, lzma.CHECK_CRC64])
+    return XZ_HEADER_MAGIC + stream_flags + struct.pack("<I", zlib.crc32(stream_flags))
 
 
-def main():
-    """主函数"""
-    args = parse_command_line_args()
-    
-    print_info()
+def build_xz_index_and_footer(records: List[Tuple[int, int]]) -> bytes:
+    """生成 xz 索引和流尾
+
+    Args:
+        records: 各块的 (未填充大小, 原始大小) 列表
+
+    Returns:
+        bytes: 索引和流尾
+    """
+    index = bytearray(b"\x00")
+    index += encode_xz_varint(len(records))
+    for unpadded_size, uncompressed_size in records:
+        index += encode_xz_varint(unpadded_size)
+        index += encode_xz_varint(uncompressed_size)
+    index += b"\x00" * (-len(index) % 4)
+    index += struct.pack("<I", zlib.crc32(index))
     
-    config = load_config(CONFIG_FILE)
-    log_folder = config.get("log_folder", "logs")
-    max_log_files = config.get("max_log_files", 15)
-    log_level = config.get("log_level", logging.INFO)
-    save_logs = config.get("save_logs", True)
+    stream_flags = bytes([0x00, lzma.CHECK_CRC64])
+    footer_body = struct.pack("<I", len(index) // 4 - 1) + stream_flags
+    return bytes(index) + struct.pack("<I", zlib.crc32(footer_body)) + footer_body + XZ_FOOTER_MAGIC
+
+
+def is_incompressible(file_path: str) -> bool:
+    """根据文件开头 ENTROPY_SAMPLE_SIZE 字节的字节分布估算熵，判断文件是否不可压缩
+
+    Args:
+        file_path: 文件路径
+
+    Returns:
+        bool: 熵不低于 ENTROPY_THRESHOLD（比特/字节）时返回 True
+    """
+    with open(file_path, "rb") as f:
+        sample = f.read(ENTROPY_SAMPLE_SIZE)
+    if not sample:
+        return False
     
-    # 命令行参数覆盖配置文件
+    total = len(sample)
+    entropy = -sum(count / total * math.log2(count / total) for count in collections.Counter(sample).values())
+    return entropy >= ENTROPY_THRESHOLD
+
+
+def read_sample(file_path: str) -> bytes:
+    """从文件中均匀抽取 AUTO_SAMPLE_SLICES 段数据作为样本，小文件直接返回全部内容
+
+    Args:
+        file_path: 文件路径
+
+    Returns:
+        bytes: 样本数据
+    """
+    file_size = os.path.getsize(file_path)
+    sample_size = AUTO_SAMPLE_SLICES * AUTO_SAMPLE_SLICE_SIZE
+    with open(file_path, "rb") as f:
+        if file_size <= sample_size:
+            return f.read()
+        
+        slices = []
+        step = (file_size - AUTO_SAMPLE_SLICE_SIZE) // (AUTO_SAMPLE_SLICES - 1)
+        for index in range(AUTO_SAMPLE_SLICES):
+            f.seek(index * step)
+            slices.append(f.read(AUTO_SAMPLE_SLICE_SIZE))
+        return b"".join(slices)
+
+
+def choose_compression(sample: bytes, auto_tolerance: int) -> Tuple[str, int, Optional[bytes]]:
+    """对文件样本试压缩，选择压缩算法和压缩等级
+
+    使用 AUTO_CANDIDATES 中的每种组合压缩样本，在压缩后大小不超过最优结果
+    (100 + auto_tolerance)% 的候选中选择耗时最短的一个。
+    同时返回该候选的试压缩输出，样本即整个文件时调用方可直接使用，无需再压缩一遍。
+
+    Args:
+        sample: read_sample 读取的样本
+        auto_tolerance: 压缩率容差（百分比）
+
+    Returns:
+        Tuple[str, int, Optional[bytes]]: (压缩算法, 压缩等级, 试压缩输出)，样本为空时试压缩输出为 None
+    """
+    if not sample:
+        return AUTO_CANDIDATES[0] + (None,)
+    
+    measurements = []
+    for algorithm, level in AUTO_CANDIDATES:
+        # 样本很小，使用与样本相当的字典即可得到相同的压缩率，避免分配完整字典
+        compressor = create_compressor(algorithm, level, dict_size=lzma_dict_size(len(sample)))
+        start_time = time.perf_counter()
+        compressed = compressor.compress(sample) + compressor.flush()
+        measurements.append((algorithm, level, compressed, time.perf_counter() - start_time))
+    
+    best_size = min(len(measurement[2]) for measurement in measurements)
+    acceptable = [m for m in measurements if len(m[2]) <= best_size * (100 + auto_tolerance) / 100]
+    algorithm, level, compressed, _ = min(acceptable, key=lambda m: m[3])
+    return algorithm, level, compressed
+
+
+def compress_file(file_path: str, options: CompressOptions, compressor_cache: Optional[dict] = None, offset: int = 0, auto_choices: Optional[dict] = None) -> CompressResult:
+    """流式压缩单个文件
+
+    按块读取并逐块送入压缩器，压缩输出写入临时文件（小于 SPOOL_MAX_SIZE 时保留在内存中），
+    单个线程的内存占用与文件大小无关。多进程模式下输出写入 temp_dir 中的命名临时文件。
+
+    Args:
+        file_path: 文件路径
+        options: 压缩选项
+        compressor_cache: 可复用压缩器缓存（可选），同一工作线程内的多个文件共用
+        offset: 开始压缩的位置，追加增量时跳过已归档的部分
+        auto_choices: 自动选择结果缓存（可选，扩展名 -> (压缩算法, 压缩等级)），同一批文件共用
+
+    Returns:
+        CompressResult: 压缩结果，多进程模式下 compressed_data 为临时文件路径
+    """
+    start_time = time.perf_counter()
+    start_cpu = time.thread_time()
+    compression_algorithm = options.compression_algorithm.lower()
+    compression_level = options.compression_level
+    if options.store_incompressible and is_incompressible(file_path):
+        compression_algorithm, compression_level = "store", 0
+    trial_output = None
+    sample = b""
+    if compression_algorithm == "auto":
+        file_type = os.path.splitext(file_path)[1].lower()
+        if auto_choices is not None and file_type in auto_choices:
+            compression_algorithm, compression_level = auto_choices[file_type]
+        else:
+            sample = read_sample(file_path)
+            compression_algorithm, compression_level, trial_output = choose_compression(sample, options.auto_tolerance)
+            if auto_choices is not None:
+                auto_choices[file_type] = (compression_algorithm, compression_level)
+    algorithm = compression_algorithm
+    stored = algorithm == "store"
+    native = options.entry_format == "native" or algorithm == "deflate"
+    file_size = os.path.getsize(file_path) - offset
+    if offset or len(sample) != file_size or (native and algorithm == "lzma"):
+        # 样本不是整个文件，或试压缩输出与条目格式不符（native 条目格式的 lzma 为原始 LZMA1 数据流）
+        trial_output = None
+    large_file = options.block_workers > 1 and 0 < options.parallel_threshold <= file_size
+    dict_size = lzma_dict_size(file_size)
+    # 标准解压工具不支持多流的 native BZIP2 / LZMA 条目，只在文件之间并行；zstd 使用 libzstd 自带的多线程压缩
+    use_blocks = large_file and (algorithm == "deflate" or not native and algorithm in ["bzip2", "lzma"])
+    if options.temp_dir:
+        output = tempfile.NamedTemporaryFile(dir=options.temp_dir, suffix=".tmp", delete=False)
+    else:
+        output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    original_size = 0
+    crc = 0
+    busy_time = 0.0
+    hasher = hashlib.sha256()
+    
+    try:
+        with open(file_path, "rb") as f:
+            if options.page_cache_hints:
+                fadvise(f.fileno(), "POSIX_FADV_SEQUENTIAL")
+                fadvise(f.fileno(), "POSIX_FADV_WILLNEED")
+            if offset:
+                f.seek(offset)
+            if trial_output is not None:
+                original_size = len(sample)
+                crc = zlib.crc32(sample)
+                hasher.update(sample)
+                output.write(trial_output)
+            elif stored:
+                for chunk in iter_file_chunks(f, options.chunk_size):
+                    original_size += len(chunk)
+                    crc = zlib.crc32(chunk, crc)
+                    hasher.update(chunk)
+                    output.write(chunk)
+            elif use_blocks and algorithm == "bzip2":
+                # 每个任务恰好对应一个 bzip2 压缩块
+                compress_block = functools.partial(bz2.compress, compresslevel=compression_level)
+                original_size, crc, busy_time = compress_blocks_parallel(f, output.write, compress_block, compression_level * BZIP2_BLOCK_UNIT, options.block_workers, hasher=hasher)
+            elif use_blocks and algorithm == "deflate":
+                compress_block = functools.partial(compress_deflate_block, compression_level=compression_level)
+                original_size, crc, busy_time = compress_blocks_parallel(f, output.write, compress_block, DEFLATE_BLOCK_SIZE, options.block_workers, DEFLATE_DICT_SIZE, hasher)
+                # 追加空的结束块
+                output.write(zlib.compressobj(compression_level, zlib.DEFLATED, -zlib.MAX_WBITS).flush())
+            elif use_blocks:
+                # 字典大于块大小没有意义，只会增加内存占用
+                lzma_filters = [
+                    {"id": lzma.FILTER_LZMA2, "preset": compression_level, "dict_size": min(dict_size, LZMA_BLOCK_SIZE)}
+                ]
+                index_records = []
+                
+                def write_xz_block(result: Tuple[bytes, int, int]) -> None:
+                    output.write(result[0])
+                    index_records.append(result[1:])
+                
+                output.write(build_xz_stream_header())
+                compress_block = functools.partial(compress_xz_block, filters=lzma_filters)
+                original_size, crc, busy_time = compress_blocks_parallel(f, write_xz_block, compress_block, LZMA_BLOCK_SIZE, options.block_workers, hasher=hasher)
+                output.write(build_xz_index_and_footer(index_records))
+            else:
+                zstd_workers = options.block_workers if large_file else 0
+                if compressor_cache is not None and algorithm == "zstd" and not large_file:
+                    # flush() 结束当前帧后压缩器即可开始下一个帧
+                    compressor = compressor_cache.get((algorithm, compression_level))
+                    if compressor is None:
+                        compressor = compressor_cache[(algorithm, compression_level)] = create_compressor(compression_algorithm, compression_level, options.entry_format)
+                else:
+                    compressor = create_compressor(compression_algorithm, compression_level, options.entry_format, zstd_workers, dict_size)
+                if native and algorithm == "lzma":
+                    output.write(build_zip_lzma_header(dict_size))
+                for chunk in iter_file_chunks(f, options.chunk_size):
+                    original_size += len(chunk)
+                    crc = zlib.crc32(chunk, crc)
+                    hasher.update(chunk)
+                    output.write(compressor.compress(chunk))
+                output.write(compressor.flush())
+            if options.page_cache_hints:
+                fadvise(f.fileno(), "POSIX_FADV_DONTNEED")
+    except Exception:
+        output.close()
+        if options.temp_dir:
+            os.remove(output.name)
+        if compressor_cache:
+            # 压缩器可能停在帧中间，不能再复用
+            compressor_cache.clear()
+        raise
+    
+    compressed_size = output.tell()
+    compress_type = NATIVE_COMPRESS_TYPES[algorithm] if native and not stored else zipfile.ZIP_STORED
+    elapsed = time.perf_counter() - start_time
+    if large_file and algorithm == "zstd":
+        # libzstd 的压缩线程不计入当前线程的 CPU 时间，按各线程在整个压缩期间同时工作估算
+        busy_time = elapsed * options.block_workers
+    else:
+        # 当前线程的读取和校验，加上分块线程的压缩
+        busy_time += time.thread_time() - start_cpu
+    if options.temp_dir:
+        output.close()
+        return CompressResult(os.path.basename(file_path), output.name, original_size, compressed_size, crc, compress_type, algorithm, compression_level, elapsed, hasher.hexdigest(), busy_time=busy_time)
+    
+    output.seek(0)
+    return CompressResult(os.path.basename(file_path), output, original_size, compressed_size, crc, compress_type, algorithm, compression_level, elapsed, hasher.hexdigest(), busy_time=busy_time)
+
+
+def compress_batch(file_paths: List[str], options: CompressOptions, offsets: Optional[dict] = None) -> List[Tuple[str, Union[CompressResult, Exception]]]:
+    """在同一个工作线程中依次压缩一批文件，分摊任务提交和压缩器初始化的开销
+
+    单个文件压缩失败不影响同批的其他文件。
+    压缩算法为 auto 时同一批中同一扩展名的文件沿用第一个文件的选择结果。
+
+    Args:
+        file_paths: 文件路径列表
+        options: 压缩选项
+        offsets: 追加增量文件的开始压缩位置（文件路径 -> 偏移，可选）
+
+    Returns:
+        List[Tuple[str, Union[CompressResult, Exception]]]: (文件路径, 压缩结果或异常) 列表
+    """
+    compressor_cache = {}
+    auto_choices = {}
+    results = []
+    for file_path in file_paths:
+        try:
+            results.append((file_path, compress_file(file_path, options, compressor_cache, (offsets or {}).get(file_path, 0), auto_choices)))
+        except Exception as e:
+            results.append((file_path, e))
+    return results
+
+
+def release_compressed_data(compressed_data: Union[BinaryIO, str]) -> None:
+    """释放压缩数据临时文件
+
+    Args:
+        compressed_data: 压缩数据临时文件或其路径
+    """
+    if isinstance(compressed_data, str):
+        if os.path.exists(compressed_data):
+            os.remove(compressed_data)
+    else:
+        compressed_data.close()
+
+
+def write_compressed_entry(zipf: zipfile.ZipFile, result: CompressResult, compressed_data: BinaryIO, chunk_size: int) -> None:
+    """将已压缩的数据流式写入 ZIP 文件
+
+    stored 条目直接以存储模式写入，并在条目注释中记录压缩算法。追加增量条目的注释中另外记录
+    基础条目的大小和名称（delta:<偏移>:<基础条目名>）。native 条目的数据已经是
+    ZIP 规范的 BZIP2 / LZMA 格式，先以存储模式原样写入，再把本地文件头改写为对应的压缩方式、
+    原始数据 CRC 和原始大小，从而在写入线程之外完成压缩。
+
+    Args:
+        zipf: 已打开的 ZIP 文件
+        result: 压缩结果
+        compressed_data: 压缩数据文件
+        chunk_size: 块大小
+    """
+    zinfo = zipfile.ZipInfo(result.arcname, time.localtime()[:6])
+    zinfo.compress_type = zipfile.ZIP_STORED
+    comment = result.algorithm if result.compress_type == zipfile.ZIP_STORED else ""
+    if result.delta_base:
+        comment = f"{comment} {DELTA_PREFIX}{result.delta_offset}:{result.delta_base}".lstrip()
+    zinfo.comment = comment.encode("utf-8")
+    # 预先设置写入大小，以便 zipfile 判断是否需要 ZIP64
+    zinfo.file_size = max(result.compressed_size, result.original_size)
+    zip64 = zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+    with zipf.open(zinfo, "w") as dest:
+        shutil.copyfileobj(compressed_data, dest, chunk_size)
+    
+    if result.compress_type == zipfile.ZIP_STORED:
+        return
+    
+    zinfo.compress_type = result.compress_type
+    zinfo.CRC = result.crc
+    zinfo.file_size = result.original_size
+    if result.compress_type == zipfile.ZIP_LZMA:
+        zinfo.flag_bits |= ZIP_LZMA_EOS_FLAG
+    # 改写本地文件头（长度不变），中央目录在关闭归档时按更新后的信息写入
+    zipf.fp.seek(zinfo.header_offset)
+    zipf.fp.write(zinfo.FileHeader(zip64))
+    zipf.fp.seek(zipf.start_dir)
+
+
+def discard_partial_entries(zipf: zipfile.ZipFile, entry_count: int) -> None:
+    """丢弃写入失败的条目：移除 filelist 中第 entry_count 个之后的条目，并把归档截断到被丢弃条目的起始位置
+
+    写入中途出错时 zipfile 仍会登记已写入一部分的条目，不丢弃的话关闭归档时会写入中央目录。
+
+    Args:
+        zipf: 已打开的 ZIP 文件
+        entry_count: 写入前的条目数
+    """
+    # 条目尚未登记时（写入本地文件头时出错）start_dir 仍是该条目的起始位置
+    start = zipf.start_dir
+    while len(zipf.filelist) > entry_count:
+        zinfo = zipf.filelist.pop()
+        if zipf.NameToInfo.get(zinfo.filename) is zinfo:
+            previous = next((info for info in reversed(zipf.filelist) if info.filename == zinfo.filename), None)
+            if previous is None:
+                del zipf.NameToInfo[zinfo.filename]
+            else:
+                zipf.NameToInfo[zinfo.filename] = previous
+        start = zinfo.header_offset
+    zipf.start_dir = start
+    zipf.fp.seek(start)
+    zipf.fp.truncate()
+
+
+def parse_entry_comment(comment: bytes) -> Tuple[str, int, str]:
+    """解析 write_compressed_entry 写入的条目注释
+
+    Args:
+        comment: 条目注释
+
+    Returns:
+        Tuple[str, int, str]: (压缩算法, 基础条目大小, 基础条目名)，不是追加增量条目时后两项为 0 和空字符串
+    """
+    algorithm, separator, delta = comment.decode("utf-8", "replace").partition(DELTA_PREFIX)
+    if not separator:
+        return algorithm.strip(), 0, ""
+    delta_offset, _, delta_base = delta.partition(":")
+    return algorithm.strip(), int(delta_offset), delta_base
+
+
+def create_decompressor(algorithm: str):
+    """创建 stored 条目数据的流式解压器
+
+    Args:
+        algorithm: 压缩算法
+
+    Returns:
+        流式解压器对象
+    """
+    if algorithm == "lzma":
+        return lzma.LZMADecompressor()
+    elif algorithm == "bzip2":
+        return bz2.BZ2Decompressor()
+    elif algorithm == "zstd" and zstd is not None:
+        return zstd.ZstdDecompressor()
+    raise ValueError(f"不支持的压缩算法: {algorithm}")
+
+
+def iter_decompressed(f: BinaryIO, algorithm: str, chunk_size: int) -> Iterator[bytes]:
+    """逐块解压 stored 条目的数据，支持分块并行压缩输出的多流 bzip2 数据
+
+    Args:
+        f: 条目数据
+        algorithm: 压缩算法
+        chunk_size: 块大小
+
+    Yields:
+        bytes: 解压后的数据
+    """
+    decompressor = create_decompressor(algorithm)
+    for chunk in iter(functools.partial(f.read, chunk_size), b""):
+        while chunk:
+            yield decompressor.decompress(chunk)
+            if not decompressor.eof:
+                break
+            # 一个数据流结束，剩余数据属于下一个数据流
+            chunk = decompressor.unused_data
+            decompressor = create_decompressor(algorithm)
+
+
+def extract_entry(zipf: zipfile.ZipFile, name: str, output: BinaryIO, chunk_size: int) -> int:
+    """将条目还原为原始文件内容写入 output
+
+    追加增量条目先还原基础条目，再写入追加的部分；引用条目还原被引用的条目，
+    引用其他归档的条目（归档文件名/条目名）时打开同一文件夹中的该归档。
+
+    Args:
+        zipf: 已打开的 ZIP 文件
+        name: 条目名
+        output: 输出文件
+        chunk_size: 块大小
+
+    Returns:
+        int: 写入的字节数
+    """
+    info = zipf.getinfo(name)
+    algorithm, delta_offset, delta_base = parse_entry_comment(info.comment)
+    written = 0
+    if delta_base:
+        written = extract_entry(zipf, delta_base, output, chunk_size)
+        if written != delta_offset:
+            raise ValueError(f"基础条目 {delta_base} 的大小与追加增量条目 {name} 记录的不一致")
+    
+    with zipf.open(info) as f:
+        if info.compress_type != zipfile.ZIP_STORED:
+            # native 条目由 zipfile 解压
+            chunks = iter(functools.partial(f.read, chunk_size), b"")
+        else:
+            if not algorithm:
+                header = f.peek(8)
+                algorithm = next((name for magic, name in COMPRESSED_MAGIC.items() if header.startswith(magic)), "store")
+            if algorithm == CONTENT_REFERENCE:
+                target_archive, target = split_reference(f.read().decode("utf-8"))
+                if not target_archive:
+                    return written + extract_entry(zipf, target, output, chunk_size)
+                with zipfile.ZipFile(os.path.join(os.path.dirname(zipf.filename), target_archive), "r") as target_zipf:
+                    return written + extract_entry(target_zipf, target, output, chunk_size)
+            if algorithm == "store":
+                chunks = iter(functools.partial(f.read, chunk_size), b"")
+            else:
+                chunks = iter_decompressed(f, algorithm, chunk_size)
+        for chunk in chunks:
+            output.write(chunk)
+            written += len(chunk)
+    return written
+
+
+def get_versioned_name(arcname: str, existing_files: Union[set, "ArchiveIndex"]) -> str:
+    """为重复文件生成下一个版本的条目名：文件名;2、文件名;3 ...
+
+    Args:
+        arcname: 条目名
+        existing_files: 归档中已存在的文件名集合（或归档索引）
+
+    Returns:
+        str: 新版本的条目名
+    """
+    version = 2
+    while f"{arcname}{VERSION_SEPARATOR}{version}" in existing_files:
+        version += 1
+    return f"{arcname}{VERSION_SEPARATOR}{version}"
+
+
+def get_base_name(arcname: str) -> str:
+    """去掉条目名中的版本序号（文件名;2 -> 文件名）
+
+    Args:
+        arcname: 条目名
+
+    Returns:
+        str: 原始文件名
+    """
+    base, separator, version = arcname.rpartition(VERSION_SEPARATOR)
+    return base if separator and version.isdigit() else arcname
+
+
+def split_reference(target: str) -> Tuple[str, str]:
+    """拆分引用目标：归档文件名/条目名 -> (归档文件名, 条目名)，同一归档中的条目归档文件名为空字符串
+
+    Args:
+        target: 引用目标
+
+    Returns:
+        Tuple[str, str]: (归档文件名, 条目名)
+    """
+    target_archive, _, name = target.rpartition("/")
+    return target_archive, name
+
+
+def hash_file(file_path: str, chunk_size: int) -> str:
+    """计算文件内容的 SHA-256
+
+    Args:
+        file_path: 文件路径
+        chunk_size: 块大小
+
+    Returns:
+        str: 十六进制 SHA-256
+    """
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter_file_chunks(f, chunk_size):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def build_reference_result(arcname: str, target: str, original_size: int, sha256: str) -> CompressResult:
+    """生成引用条目：以存储模式写入目标条目名，条目注释为 ref，original_size 记录被引用内容的大小
+
+    Args:
+        arcname: 条目名
+        target: 内容相同的目标条目名
+        original_size: 文件原始大小
+        sha256: 文件内容的 SHA-256
+
+    Returns:
+        CompressResult: 引用条目的压缩结果
+    """
+    data = target.encode("utf-8")
+    return CompressResult(arcname, io.BytesIO(data), original_size, len(data), zlib.crc32(data), zipfile.ZIP_STORED, CONTENT_REFERENCE, 0, 0.0, sha256)
+
+
+def find_content_targets(sha256: str, size: int, archive_path: str, index: Optional["ArchiveIndex"], content_store: Optional["ContentStore"]) -> List[str]:
+    """查找内容相同的条目：先查询当前归档的索引，没有时查询归档文件夹的内容哈希库
+
+    Args:
+        sha256: 文件内容的 SHA-256
+        size: 文件原始大小
+        archive_path: 当前归档文件路径
+        index: 当前归档的归档索引（可选）
+        content_store: 内容哈希库（可选）
+
+    Returns:
+        List[str]: 引用目标列表，当前归档中的条目为条目名，其他归档中的条目为 归档文件名/条目名
+    """
+    targets = index.find_content(sha256, size) if index is not None else []
+    if not targets and content_store is not None:
+        archive_name = os.path.basename(archive_path)
+        targets = [name if target_archive == archive_name else f"{target_archive}/{name}"
+                   for target_archive, name in content_store.find_content(sha256, size)]
+    return targets
+
+
+def find_duplicate_content(file_path: str, file_size: int, archive_path: str, index: Optional["ArchiveIndex"], content_store: Optional["ContentStore"], chunk_size: int) -> Optional[CompressResult]:
+    """检查文件内容是否已归档：只有索引或内容哈希库中存在相同大小的条目时才计算哈希
+
+    Args:
+        file_path: 文件路径
+        file_size: 文件大小
+        archive_path: 当前归档文件路径
+        index: 当前归档的归档索引（可选）
+        content_store: 内容哈希库（可选）
+        chunk_size: 块大小
+
+    Returns:
+        Optional[CompressResult]: 内容已归档时返回引用条目，否则为 None
+    """
+    if not ((index is not None and index.has_size(file_size)) or (content_store is not None and content_store.has_size(file_size))):
+        return None
+    sha256 = hash_file(file_path, chunk_size)
+    targets = find_content_targets(sha256, file_size, archive_path, index, content_store)
+    if not targets:
+        return None
+    arcname = os.path.basename(file_path)
+    # 优先引用同名文件的某个版本，此时写入线程直接跳过该文件
+    target = next((name for name in targets if get_base_name(split_reference(name)[1]) == arcname), targets[0])
+    return build_reference_result(arcname, target, file_size, sha256)
+
+
+def find_delta_base(file_path: str, file_size: int, index: "ArchiveIndex", chunk_size: int) -> Optional[Tuple[str, int, str]]:
+    """检查文件是否由归档中的最新版本追加内容而来：开头与该版本的大小和 SHA-256 一致
+
+    边读取边计算哈希，读到最新版本的长度时开头不一致即停止读取。
+
+    Args:
+        file_path: 文件路径
+        file_size: 文件大小
+        index: 归档索引
+        chunk_size: 块大小
+
+    Returns:
+        Optional[Tuple[str, int, str]]: (基础条目名, 基础条目大小, 整个文件的 SHA-256)，不是追加时为 None
+    """
+    latest = get_latest_version(os.path.basename(file_path), index)
+    content = index.get_content(latest) if latest is not None else None
+    if content is None:
+        return None
+    base_size, base_sha256 = content
+    if not base_sha256 or not 0 < base_size < file_size:
+        return None
+    
+    hasher = hashlib.sha256()
+    position = 0
+    with open(file_path, "rb") as f:
+        for chunk in iter_file_chunks(f, chunk_size):
+            if position < base_size <= position + len(chunk):
+                split = base_size - position
+                hasher.update(chunk[:split])
+                # hexdigest 不影响之后继续计算
+                if hasher.hexdigest() != base_sha256:
+                    return None
+                hasher.update(chunk[split:])
+            else:
+                hasher.update(chunk)
+            position += len(chunk)
+    return latest, base_size, hasher.hexdigest()
+
+
+def get_latest_version(arcname: str, existing_files: Union[set, "ArchiveIndex"]) -> Optional[str]:
+    """查找文件的最新版本条目名，只需查询集合或归档索引，不需要打开其他归档
+
+    Args:
+        arcname: 原始文件名
+        existing_files: 归档中已存在的文件名集合（或归档索引）
+
+    Returns:
+        Optional[str]: 最新版本的条目名，归档中没有该文件时为 None
+    """
+    if arcname not in existing_files:
+        return None
+    latest = arcname
+    version = 2
+    while f"{arcname}{VERSION_SEPARATOR}{version}" in existing_files:
+        latest = f"{arcname}{VERSION_SEPARATOR}{version}"
+        version += 1
+    return latest
+
+
+def get_duplicate_archive_path(archive_path: str) -> str:
+    """生成保存重复文件的归档文件路径（带日期时间戳）
+
+    Args:
+        archive_path: 主归档文件路径
+
+    Returns:
+        str: 重复文件归档路径
+    """
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    base_name = os.path.basename(archive_path)
+    if base_name.endswith('.zip'):
+        base_name = base_name[:-4]
+    return os.path.join(os.path.dirname(archive_path), f"重复文件_{base_name}_{timestamp}.zip")
+
+
+def read_zip_end_record(f: BinaryIO) -> Tuple[int, int, int]:
+    """只读取文件末尾，解析中央目录结束记录（支持 ZIP64），不解析中央目录本身
+
+    Args:
+        f: 已打开的 ZIP 文件
+
+    Returns:
+        Tuple[int, int, int]: (中央目录偏移, 中央目录大小, 条目数)
+
+    Raises:
+        zipfile.BadZipFile: 找不到有效的结束记录
+    """
+    f.seek(0, 2)
+    file_size = f.tell()
+    tail_size = min(file_size, ZIP_END_RECORD.size + ZIP_MAX_COMMENT)
+    f.seek(file_size - tail_size)
+    tail = f.read(tail_size)
+    position = tail.rfind(b"PK\x05\x06")
+    if position < 0 or len(tail) - position < ZIP_END_RECORD.size:
+        raise zipfile.BadZipFile("找不到中央目录结束记录")
+    
+    _, _, _, _, count, cd_size, cd_offset, _ = ZIP_END_RECORD.unpack_from(tail, position)
+    if count == 0xFFFF or cd_size == 0xFFFFFFFF or cd_offset == 0xFFFFFFFF:
+        locator_position = file_size - tail_size + position - ZIP64_END_LOCATOR.size
+        f.seek(locator_position)
+        signature, _, record_offset, _ = ZIP64_END_LOCATOR.unpack(f.read(ZIP64_END_LOCATOR.size))
+        if signature != b"PK\x06\x07":
+            raise zipfile.BadZipFile("找不到 ZIP64 结束记录定位器")
+        f.seek(record_offset)
+        record = ZIP64_END_RECORD.unpack(f.read(ZIP64_END_RECORD.size))
+        if record[0] != b"PK\x06\x06":
+            raise zipfile.BadZipFile("找不到 ZIP64 中央目录结束记录")
+        count, cd_size, cd_offset = record[7], record[8], record[9]
+    return cd_offset, cd_size, count
+
+
+def build_zip_end_record(count: int, cd_size: int, cd_offset: int) -> bytes:
+    """生成中央目录结束记录，超出限制时与 zipfile 一样附加 ZIP64 结束记录和定位器
+
+    Args:
+        count: 条目数
+        cd_size: 中央目录大小
+        cd_offset: 中央目录偏移
+
+    Returns:
+        bytes: 结束记录
+    """
+    records = b""
+    if count >= 0xFFFF or cd_size > zipfile.ZIP64_LIMIT or cd_offset > zipfile.ZIP64_LIMIT:
+        records += ZIP64_END_RECORD.pack(b"PK\x06\x06", ZIP64_END_RECORD.size - 12, 45, 45, 0, 0, count, count, cd_size, cd_offset)
+        records += ZIP64_END_LOCATOR.pack(b"PK\x06\x07", 0, cd_offset + cd_size, 1)
+        count, cd_size, cd_offset = min(count, 0xFFFF), 0xFFFFFFFF, 0xFFFFFFFF
+    return records + ZIP_END_RECORD.pack(b"PK\x05\x06", 0, 0, count, count, cd_size, cd_offset, 0)
+
+
+class ArchiveIndex:
+    """归档文件的旁路索引
+
+    以 SQLite 数据库保存在归档文件旁，记录每个条目的名称、本地文件头偏移、大小、CRC 和 SHA-256，
+    以及归档文件的大小、修改时间和中央目录位置。查重只需按名称查询索引；追加时从索引得知中央目录位置，
+    新条目覆盖旧中央目录写入后，再原样写回旧中央目录的字节并接上新条目的中央目录，
+    不再逐条解析已有条目，开销只与新增文件数有关。
+    归档文件的大小或修改时间与索引记录不一致（被其他程序修改或上次写入中断）时，从归档重建索引。
+    SHA-256 同时用于查找当前归档中内容相同的条目和追加增量的基础条目。
+    """
+    
+    def __init__(self, archive_path: str):
+        self.archive_path = archive_path
+        self.index_path = archive_path + INDEX_SUFFIX
+        # 写入线程与主线程先后使用同一连接
+        self.connection = sqlite3.connect(self.index_path, check_same_thread=False)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                name TEXT PRIMARY KEY,
+                header_offset INTEGER NOT NULL,
+                compressed_size INTEGER NOT NULL,
+                original_size INTEGER NOT NULL,
+                crc INTEGER NOT NULL,
+                algorithm TEXT,
+                sha256 TEXT
+            );
+            CREATE INDEX IF NOT EXISTS entries_content ON entries (original_size, sha256);
+            CREATE TABLE IF NOT EXISTS archive (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+        """)
+        self.append_file = None
+        self.old_central_directory = b""
+        self.old_count = 0
+    
+    def __contains__(self, name: str) -> bool:
+        return self.connection.execute("SELECT 1 FROM entries WHERE name = ?", (name,)).fetchone() is not None
+    
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+    
+    def has_size(self, size: int) -> bool:
+        """索引中是否有原始大小为 size 且记录了 SHA-256 的条目，大小不同的文件内容不可能相同，无需计算哈希"""
+        return self.connection.execute(
+            "SELECT 1 FROM entries WHERE original_size = ? AND sha256 IS NOT NULL AND algorithm IS NOT ? LIMIT 1",
+            (size, CONTENT_REFERENCE)
+        ).fetchone() is not None
+    
+    def find_content(self, sha256: str, size: int) -> List[str]:
+        """返回内容（SHA-256 和原始大小）完全相同的条目名，不包括引用条目"""
+        rows = self.connection.execute(
+            "SELECT name FROM entries WHERE original_size = ? AND sha256 = ? AND algorithm IS NOT ? ORDER BY header_offset",
+            (size, sha256, CONTENT_REFERENCE)
+        ).fetchall()
+        return [row[0] for row in rows]
+    
+    def get_content(self, name: str) -> Optional[Tuple[int, str]]:
+        """返回条目的原始大小和 SHA-256，条目不存在或为引用条目时为 None"""
+        row = self.connection.execute(
+            "SELECT original_size, sha256 FROM entries WHERE name = ? AND algorithm IS NOT ?",
+            (name, CONTENT_REFERENCE)
+        ).fetchone()
+        return tuple(row) if row is not None else None
+    
+    def get_state(self) -> dict:
+        """返回索引记录的归档状态（size、mtime_ns、cd_offset、cd_size、count）"""
+        return dict(self.connection.execute("SELECT key, value FROM archive").fetchall())
+    
+    def is_synced(self) -> bool:
+        """索引记录的归档大小和修改时间是否与归档文件一致"""
+        state = self.get_state()
+        if not os.path.exists(self.archive_path):
+            return not state and len(self) == 0
+        stat = os.stat(self.archive_path)
+        return state.get("size") == stat.st_size and state.get("mtime_ns") == stat.st_mtime_ns
+    
+    def rebuild(self) -> None:
+        """解析归档的中央目录重建索引
+
+        偏移和压缩大小与旧索引记录一致的条目保留原来的原始大小和 SHA-256，其余条目的 SHA-256 无法得知，记为空。
+        """
+        known = {
+            row[0]: row[1:]
+            for row in self.connection.execute("SELECT name, header_offset, compressed_size, original_size, sha256 FROM entries WHERE sha256 IS NOT NULL")
+        }
+        
+        def build_row(info: zipfile.ZipInfo) -> tuple:
+            original_size, sha256 = info.file_size, None
+            if info.filename in known and known[info.filename][:2] == (info.header_offset, info.compress_size):
+                original_size, sha256 = known[info.filename][2:]
+            return (info.filename, info.header_offset, info.compress_size, original_size, info.CRC, parse_entry_comment(info.comment)[0] or None, sha256)
+        
+        with self.connection:
+            self.connection.execute("DELETE FROM entries")
+            self.connection.execute("DELETE FROM archive")
+            if not os.path.exists(self.archive_path):
+                return
+            with zipfile.ZipFile(self.archive_path, "r") as zipf:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (build_row(info) for info in zipf.infolist() if not info.filename.endswith("/"))
+                )
+            self.save_state()
+    
+    def save_state(self) -> None:
+        """记录归档文件当前的大小、修改时间和中央目录位置（需在事务中调用）"""
+        with open(self.archive_path, "rb") as f:
+            cd_offset, cd_size, count = read_zip_end_record(f)
+        stat = os.stat(self.archive_path)
+        state = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "cd_offset": cd_offset, "cd_size": cd_size, "count": count}
+        self.connection.executemany("INSERT OR REPLACE INTO archive VALUES (?, ?)", state.items())
+    
+    def open_append(self) -> zipfile.ZipFile:
+        """打开归档用于追加：读出旧中央目录的原始字节，返回从旧中央目录位置开始写入新条目的 ZipFile
+
+        Returns:
+            zipfile.ZipFile: 只包含新条目的写入模式 ZipFile，关闭后需调用 finish
+        """
+        state = self.get_state()
+        self.append_file = open(self.archive_path, "r+b")
+        self.append_file.seek(state["cd_offset"])
+        self.old_central_directory = self.append_file.read(state["cd_size"])
+        self.old_count = state["count"]
+        self.append_file.seek(state["cd_offset"])
+        return zipfile.ZipFile(self.append_file, "w", zipfile.ZIP_STORED)
+    
+    def add(self, zinfo: zipfile.ZipInfo, result: CompressResult) -> None:
+        """记录新写入的条目，在 finish 时随归档状态一起提交"""
+        self.connection.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+            # stored 条目的 file_size 是压缩数据的长度，原始大小取自压缩结果，追加增量条目记录还原后的大小
+            (zinfo.filename, zinfo.header_offset, zinfo.compress_size, result.delta_offset + result.original_size, result.crc, result.algorithm, result.sha256)
+        )
+    
+    def finish(self, zipf: zipfile.ZipFile, synced: bool = True) -> None:
+        """归档关闭后调用：追加模式下把旧中央目录接回新条目的中央目录之前，然后提交索引
+
+        Args:
+            zipf: 已关闭的 ZipFile
+            synced: 归档内容是否与索引记录一致，为 False 时不记录归档状态，下次运行时重建索引
+        """
+        if self.append_file is not None:
+            f = self.append_file
+            try:
+                # zipf 只写出了新条目的中央目录，先截掉其后残留的旧数据，再取出与旧中央目录合并重写
+                f.truncate()
+                new_cd_offset, new_cd_size, new_count = read_zip_end_record(f)
+                f.seek(new_cd_offset)
+                new_central_directory = f.read(new_cd_size)
+                f.seek(new_cd_offset)
+                f.write(self.old_central_directory)
+                f.write(new_central_directory)
+                f.write(build_zip_end_record(self.old_count + new_count, len(self.old_central_directory) + new_cd_size, new_cd_offset))
+                f.truncate()
+            finally:
+                f.close()
+                self.append_file = None
+        
+        with self.connection:
+            if synced:
+                self.save_state()
+            else:
+                self.connection.execute("DELETE FROM archive")
+    
+    def close(self) -> None:
+        """关闭索引，未提交的记录被丢弃"""
+        self.connection.rollback()
+        self.connection.close()
+
+
+class ContentStore:
+    """归档文件夹的内容哈希库
+
+    以 SQLite 数据库保存在归档文件夹中（<归档文件名>.content.db，与分片目录相邻），记录各归档（包括各个分片）
+    中条目的原始大小和 SHA-256，按内容查找条目时不限于当前归档。哈希库与归档索引相互独立，重建归档索引不影响哈希库。
+    查询结果中的条目在本次运行中首次用到该归档时与归档的条目列表核对，归档或条目已不存在的记录被删除。
+    """
+    
+    def __init__(self, store_path: str):
+        self.store_path = store_path
+        self.archive_folder = os.path.dirname(store_path)
+        # 写入线程与主线程先后使用同一连接
+        self.connection = sqlite3.connect(store_path, check_same_thread=False)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS contents (
+                archive TEXT NOT NULL,
+                name TEXT NOT NULL,
+                original_size INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                PRIMARY KEY (archive, name)
+            );
+            CREATE INDEX IF NOT EXISTS contents_hash ON contents (original_size, sha256);
+        """)
+        # 归档文件名 -> 条目名集合（或归档索引），用于核对记录
+        self.entries = {}
+    
+    def set_entries(self, archive_name: str, entries: Union[set, ArchiveIndex]) -> None:
+        """指定归档的条目集合，写入该归档前调用，写入期间不读取该归档的中央目录"""
+        self.entries[archive_name] = entries
+    
+    def release_entries(self, archive_name: str) -> None:
+        """写入归档后调用：不再使用 set_entries 指定的条目集合（归档索引随后关闭），之后需要时重新读取中央目录"""
+        self.entries.pop(archive_name, None)
+    
+    def get_entries(self, archive_name: str) -> Union[set, ArchiveIndex]:
+        """返回归档的条目集合，首次调用时读取归档的中央目录，归档不存在或无法读取时为空集合"""
+        if archive_name not in self.entries:
+            try:
+                with zipfile.ZipFile(os.path.join(self.archive_folder, archive_name), "r") as zipf:
+                    self.entries[archive_name] = set(zipf.namelist())
+            except (OSError, zipfile.BadZipFile):
+                self.entries[archive_name] = set()
+        return self.entries[archive_name]
+    
+    def has_size(self, size: int) -> bool:
+        """哈希库中是否有原始大小为 size 的条目"""
+        return self.connection.execute("SELECT 1 FROM contents WHERE original_size = ? LIMIT 1", (size,)).fetchone() is not None
+    
+    def find_content(self, sha256: str, size: int) -> List[Tuple[str, str]]:
+        """返回内容（SHA-256 和原始大小）完全相同的 (归档文件名, 条目名)，删除已不存在的条目的记录"""
+        rows = self.connection.execute(
+            "SELECT archive, name FROM contents WHERE original_size = ? AND sha256 = ? ORDER BY rowid",
+            (size, sha256)
+        ).fetchall()
+        matches = []
+        for archive_name, name in rows:
+            if name in self.get_entries(archive_name):
+                matches.append((archive_name, name))
+            else:
+                self.connection.execute("DELETE FROM contents WHERE archive = ? AND name = ?", (archive_name, name))
+        return matches
+    
+    def add(self, archive_name: str, zinfo: zipfile.ZipInfo, result: CompressResult) -> None:
+        """记录新写入的条目，引用条目不记录；在 commit 时提交"""
+        if result.algorithm == CONTENT_REFERENCE or not result.sha256:
+            return
+        self.connection.execute(
+            "INSERT OR REPLACE INTO contents VALUES (?, ?, ?, ?)",
+            (archive_name, zinfo.filename, result.delta_offset + result.original_size, result.sha256)
+        )
+        entries = self.entries.setdefault(archive_name, set())
+        if isinstance(entries, set):
+            entries.add(zinfo.filename)
+    
+    def commit(self) -> None:
+        """提交新记录的条目"""
+        self.connection.commit()
+    
+    def close(self) -> None:
+        """关闭哈希库，未提交的记录被丢弃"""
+        self.connection.rollback()
+        self.connection.close()
+
+
+def archive_writer(result_queue: queue.Queue, archive_path: str, zip_mode: str, existing_files: Union[set, ArchiveIndex], index: Optional[ArchiveIndex], content_store: Optional[ContentStore], settings: ArchiveSettings, stats: dict, logger: logging.Logger) -> None:
+    """写入线程：从队列中逐个取出压缩结果并立即写入归档文件
+
+    队列中的元素为 (原始文件路径, 压缩结果)，收到 None 时结束。
+    重复文件（增量模式下归档中已存在的文件名）按 duplicate_policy 处理：version 时以
+    get_versioned_name 生成的新版本条目名写入主归档，archive 时写入单独的重复文件归档。
+    追加增量结果（delta_base 非空）同样作为新版本写入，记录在 deltas 中。
+    指定 content_store 时，内容与已写入条目相同的文件（包括预先检查得到的引用条目）不再写入数据：
+    引用同名文件的某个版本时直接跳过，否则写入引用条目，记录在 deduplicated 中；
+    写入的条目记录到 content_store，关闭归档后提交。
+    page_cache_hints 为 True 时，每写入一个条目就释放归档中已写回磁盘的页缓存，
+    关闭归档后先写回磁盘再释放其余部分。
+    指定 index 时，主归档通过 ArchiveIndex 追加，写入的条目记录到索引中。
+    写入条目出错时由 discard_partial_entries 丢弃已写入的部分，丢弃失败时不记录归档状态，下次运行时重建索引。
+
+    Args:
+        result_queue: 压缩结果队列
+        archive_path: 归档文件路径
+        zip_mode: 主归档打开模式（"w" 或 "a"）
+        existing_files: 归档中已存在的文件名集合（或归档索引）
+        index: 主归档的归档索引（可选）
+        content_store: 内容哈希库（可选）
+        settings: 归档设置
+        stats: 写入统计，写入线程在其中记录 added、duplicates、deduplicated、deltas、written_paths、duplicate_archive_path 和 error
+        logger: 日志记录器
+    """
+    archives = {}
+    index_synced = True
+    
+    def get_archive(path: str, mode: str) -> zipfile.ZipFile:
+        # 首次写入时才打开归档，避免没有内容时创建空文件
+        if path not in archives:
+            if index is not None and path == archive_path and mode == "a":
+                archives[path] = index.open_append()
+            else:
+                archives[path] = zipfile.ZipFile(path, mode, zipfile.ZIP_STORED)
+        return archives[path]
+    
+    try:
+        while True:
+            item = result_queue.get()
+            if item is None:
+                break
+            
+            file_path, result = item
+            arcname, compressed_data, original_size, compressed_size = result[:4]
+            zipf = None
+            entry_count = None
+            try:
+                if stats["error"] is not None:
+                    continue
+                
+                target = None
+                if result.algorithm == CONTENT_REFERENCE:
+                    target = result.compressed_data.getvalue().decode("utf-8")
+                elif content_store is not None:
+                    # 本次运行中已写入内容相同的文件
+                    full_size = result.delta_offset + original_size
+                    targets = find_content_targets(result.sha256, full_size, archive_path, index, content_store)
+                    if targets:
+                        target = next((name for name in targets if get_base_name(split_reference(name)[1]) == arcname), targets[0])
+                        result = build_reference_result(arcname, target, full_size, result.sha256)
+                        original_size = full_size
+                        release_compressed_data(compressed_data)
+                        compressed_data = result.compressed_data
+                        compressed_size = result.compressed_size
+                if target is not None:
+                    stats["deduplicated"].append((arcname, target, original_size))
+                    if get_base_name(split_reference(target)[1]) == arcname:
+                        # 同名文件内容相同，视为已归档
+                        logger.debug(f"内容已在归档中，跳过: {arcname} -> {target}")
+                        stats["written_paths"].append(file_path)
+                        continue
+                    logger.debug(f"内容与 {target} 相同，写入引用条目: {arcname}")
+                
+                duplicate = arcname in existing_files
+                if duplicate and settings.duplicate_policy == "version":
+                    # 重复文件，作为新版本写入主归档
+                    arcname = get_versioned_name(arcname, existing_files)
+                    result = result._replace(arcname=arcname)
+                    if result.delta_base:
+                        stats["deltas"].append((arcname, result.delta_base, result.delta_offset))
+                        logger.debug(f"写入追加增量: {arcname}（基础条目 {result.delta_base}，跳过 {format_size(result.delta_offset)}）")
+                    else:
+                        logger.debug(f"重复文件，写入新版本: {arcname}")
+                    zipf = get_archive(archive_path, zip_mode)
+                    if isinstance(existing_files, set):
+                        existing_files.add(arcname)
+                elif duplicate:
+                    # 重复文件，使用滚动模式处理
+                    logger.debug(f"重复文件: {arcname}")
+                    if stats["duplicate_archive_path"] is None:
+                        stats["duplicate_archive_path"] = get_duplicate_archive_path(archive_path)
+                    zipf = get_archive(stats["duplicate_archive_path"], "w")
+                else:
+                    # 新文件，写入主归档
+                    zipf = get_archive(archive_path, zip_mode)
+                
+                if target is None:
+                    # 引用条目不计入新增和重复文件的压缩统计
+                    if duplicate:
+                        stats["duplicates"].append((arcname, original_size, compressed_size))
+                    if zipf is archives.get(archive_path):
+                        stats["added"].append((arcname, original_size, compressed_size))
+                
+                entry_count = len(zipf.filelist)
+                if isinstance(compressed_data, str):
+                    with open(compressed_data, "rb") as f:
+                        write_compressed_entry(zipf, result, f, settings.chunk_size)
+                else:
+                    write_compressed_entry(zipf, result, compressed_data, settings.chunk_size)
+                if index is not None and zipf is archives.get(archive_path):
+                    index.add(zipf.filelist[-1], result)
+                if content_store is not None:
+                    content_store.add(os.path.basename(zipf.filename), zipf.filelist[-1], result)
+                # 条目已完整写入并记录到索引
+                entry_count = None
+                if settings.page_cache_hints:
+                    zipf.fp.flush()
+                    fadvise(zipf.fp.fileno(), "POSIX_FADV_DONTNEED")
+                stats["written_paths"].append(file_path)
+                logger.debug(f"已写入归档: {arcname}")
+            except Exception as e:
+                # 记录错误后继续取出队列中的结果，避免压缩线程阻塞
+                stats["error"] = e
+                logger.error(f"写入归档文件失败: {e}")
+                if entry_count is not None:
+                    try:
+                        discard_partial_entries(zipf, entry_count)
+                    except Exception as discard_error:
+                        logger.error(f"丢弃写入失败的条目失败: {discard_error}")
+                        if zipf is archives.get(archive_path):
+                            index_synced = False
+            finally:
+                release_compressed_data(compressed_data)
+    finally:
+        for path, zipf in archives.items():
+            zipf.close()
+            if index is not None and path == archive_path:
+                try:
+                    index.finish(zipf, index_synced)
+                except Exception as e:
+                    stats["error"] = stats["error"] or e
+                    logger.error(f"更新归档索引失败: {e}")
+            if settings.page_cache_hints:
+                drop_file_cache(path, sync=True)
+        if content_store is not None:
+            try:
+                content_store.commit()
+            except sqlite3.Error as e:
+                stats["error"] = stats["error"] or e
+                logger.error(f"更新内容哈希库失败: {e}")
+
+
+def build_downgrade_ladder(compression_algorithm: str, compression_level: int) -> List[Tuple[str, int]]:
+    """生成时间预算不足时依次使用的压缩设置，从配置的设置开始逐级加快
+
+    Args:
+        compression_algorithm: 配置的压缩算法
+        compression_level: 配置的压缩等级
+
+    Returns:
+        List[Tuple[str, int]]: (压缩算法, 压缩等级) 列表
+    """
+    fallbacks = {
+        "lzma": [("lzma", 6), ("lzma", 3), ("lzma", 1)],
+        "bzip2": [("bzip2", 1)],
+        "zstd": [("zstd", 3), ("zstd", 1)],
+        "deflate": []
+    }
+    ladder = [(compression_algorithm, compression_level)]
+    for algorithm, level in fallbacks.get(compression_algorithm, []):
+        if level < compression_level:
+            ladder.append((algorithm, level))
+    if zstd is not None and compression_algorithm not in ["zstd", "deflate"]:
+        ladder.append(("zstd", 1))
+    for level in [6, 1]:
+        if compression_algorithm != "deflate" or level < compression_level:
+            ladder.append(("deflate", level))
+    return ladder
+
+
+class DeadlinePlanner:
+    """时间预算调度器
+
+    根据已完成文件的实测吞吐量估算剩余文件的压缩耗时，预计超出时间预算时，
+    后续提交的文件改用 build_downgrade_ladder 中能按时完成的第一级压缩设置。
+    吞吐量按压缩线程的 CPU 时间计算，即单个线程的速度，分块并行压缩的文件不会被高估。
+    尚无实测数据的级别按每级 DOWNGRADE_SPEEDUP 倍的速度估算。
+    """
+    
+    def __init__(self, compression_algorithm: str, compression_level: int, time_budget: int, max_workers: int, total_bytes: int, start_time: float, logger: logging.Logger):
+        self.ladder = build_downgrade_ladder(compression_algorithm, compression_level)
+        self.time_budget = time_budget
+        # 并行度不会超过可用的 CPU 核心数
+        cpu_count = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+        self.parallelism = min(max_workers, cpu_count)
+        self.remaining_bytes = total_bytes
+        self.logger = logger
+        self.start_time = start_time
+        self.rung = 0
+        self.measured = {}
+    
+    def choose(self) -> Tuple[int, str, int]:
+        """为下一个提交的文件选择压缩设置
+
+        Returns:
+            Tuple[int, str, int]: (降级级别, 压缩算法, 压缩等级)
+        """
+        if self.time_budget > 0 and self.rung < len(self.ladder) - 1:
+            remaining_time = self.time_budget - (time.monotonic() - self.start_time)
+            if remaining_time <= 0:
+                self.rung = len(self.ladder) - 1
+                self.logger.warning(f"已超出时间预算，剩余文件改用 {self.describe(self.rung)}")
+            else:
+                rung = self.rung
+                estimated_time = self.estimate_time(rung)
+                while estimated_time is not None and estimated_time > remaining_time and rung < len(self.ladder) - 1:
+                    rung += 1
+                    estimated_time = self.estimate_time(rung)
+                if rung != self.rung:
+                    self.logger.info(f"预计剩余压缩耗时超出剩余时间预算 {remaining_time:.1f}秒，后续文件改用 {self.describe(rung)}")
+                    self.rung = rung
+        
+        return (self.rung, *self.ladder[self.rung])
+    
+    def estimate_time(self, rung: int) -> Optional[float]:
+        """估算剩余文件全部使用该级别压缩设置时的耗时
+
+        Args:
+            rung: 降级级别
+
+        Returns:
+            Optional[float]: 估算耗时（秒），没有任何实测数据时为 None
+        """
+        for measured_rung in range(rung, -1, -1):
+            bytes_done, seconds = self.measured.get(measured_rung, (0, 0.0))
+            if bytes_done > 0 and seconds > 0:
+                throughput = bytes_done / seconds * self.parallelism * DOWNGRADE_SPEEDUP ** (rung - measured_rung)
+                return self.remaining_bytes / throughput
+        return None
+    
+    def record(self, rung: int, file_size: int, elapsed: Optional[float]) -> None:
+        """记录已完成文件的耗时
+
+        Args:
+            rung: 该文件使用的降级级别
+            file_size: 文件大小
+            elapsed: 压缩线程的 CPU 时间之和（秒），压缩失败时为 None
+        """
+        self.remaining_bytes -= file_size
+        if elapsed is not None:
+            bytes_done, seconds = self.measured.get(rung, (0, 0.0))
+            self.measured[rung] = (bytes_done + file_size, seconds + elapsed)
+    
+    def describe(self, rung: int) -> str:
+        """返回降级级别对应压缩设置的描述"""
+        algorithm, level = self.ladder[rung]
+        return f"{algorithm.upper()}-{level}"
+
+
+class LoadThrottle:
+    """负载感知调度器
+
+    每隔 LOAD_SAMPLE_INTERVAL 秒采样 /proc/stat 中可用核心的 CPU 使用率和 /proc/loadavg，
+    CPU 使用率超出 load_ceiling 时将并发任务数减一，低于 load_ceiling - LOAD_HYSTERESIS 时加一；
+    并发任务数已减到 1 且 1 分钟平均负载也超出上限时暂停提交新任务，累计暂停不超过 LOAD_MAX_PAUSE 秒。
+    系统不提供 /proc/stat 时不做任何限制。
+    """
+    
+    def __init__(self, load_ceiling: int, max_workers: int, logger: logging.Logger):
+        self.load_ceiling = load_ceiling
+        self.max_workers = max_workers
+        self.logger = logger
+        self.limit = max_workers
+        self.paused = False
+        self.paused_time = 0.0
+        self.adjustments = 0
+        self.cpus = {f"cpu{cpu}" for cpu in os.sched_getaffinity(0)} if hasattr(os, "sched_getaffinity") else None
+        self.enabled = load_ceiling > 0 and os.path.exists("/proc/stat")
+        if load_ceiling > 0 and not self.enabled:
+            logger.warning("当前系统不支持读取 /proc/stat，负载上限设置无效")
+        self.last_sample = time.monotonic()
+        self.last_times = self.read_cpu_times() if self.enabled else {}
+    
+    def read_cpu_times(self) -> dict:
+        """读取可用核心的累计 CPU 时间
+
+        Returns:
+            dict: 核心名到 (忙碌时间, 总时间) 的映射
+        """
+        times = {}
+        with open("/proc/stat", "r", encoding="ascii") as f:
+            for line in f:
+                fields = line.split()
+                if not fields or not fields[0].startswith("cpu") or fields[0] == "cpu":
+                    continue
+                if self.cpus is not None and fields[0] not in self.cpus:
+                    continue
+                values = [int(value) for value in fields[1:]]
+                # idle 和 iowait 之外的时间都算作忙碌
+                idle = values[3] + (values[4] if len(values) > 4 else 0)
+                times[fields[0]] = (sum(values) - idle, sum(values))
+        return times
+    
+    def window(self, max_in_flight: int) -> int:
+        """返回当前允许的在途任务数
+
+        Args:
+            max_in_flight: 配置的最大在途任务数
+
+        Returns:
+            int: 在途任务数上限，暂停时为 0
+        """
+        if self.paused:
+            return 0
+        return max_in_flight if self.limit >= self.max_workers else self.limit
+    
+    def sample(self) -> None:
+        """距上次采样超过 LOAD_SAMPLE_INTERVAL 秒时重新采样，并调整并发任务数"""
+        now = time.monotonic()
+        if not self.enabled or now - self.last_sample < LOAD_SAMPLE_INTERVAL:
+            return
+        elapsed = now - self.last_sample
+        self.last_sample = now
+        
+        try:
+            times = self.read_cpu_times()
+            with open("/proc/loadavg", "r", encoding="ascii") as f:
+                load_average = float(f.read().split()[0])
+        except (OSError, ValueError, IndexError) as e:
+            self.logger.warning(f"读取系统负载失败，停止负载调度: {e}")
+            self.enabled = False
+            self.paused = False
+            self.limit = self.max_workers
+            return
+        
+        busy = sum(times[cpu][0] - self.last_times[cpu][0] for cpu in times if cpu in self.last_times)
+        total = sum(times[cpu][1] - self.last_times[cpu][1] for cpu in times if cpu in self.last_times)
+        self.last_times = times
+        if total <= 0:
+            return
+        usage = busy / total * 100
+        load_percent = load_average / max(len(times), 1) * 100
+        status = f"CPU 使用率 {usage:.0f}%，1 分钟平均负载 {load_average:.2f}"
+        
+        if self.paused:
+            self.paused_time += elapsed
+            if usage <= self.load_ceiling:
+                self.paused = False
+                self.adjustments += 1
+                self.logger.info(f"{status}，恢复提交任务")
+            elif self.paused_time >= LOAD_MAX_PAUSE:
+                self.paused = False
+                self.enabled = False
+                self.limit = self.max_workers
+                self.logger.warning(f"{status}，已累计暂停 {self.paused_time:.0f}秒，不再限制负载")
+        elif usage > self.load_ceiling:
+            if self.limit > 1:
+                self.limit -= 1
+                self.adjustments += 1
+                self.logger.info(f"{status}，超出负载上限 {self.load_ceiling}%，并发任务数 {self.limit + 1} -> {self.limit}")
+            elif load_percent > self.load_ceiling and self.paused_time < LOAD_MAX_PAUSE:
+                self.paused = True
+                self.adjustments += 1
+                self.logger.warning(f"{status}，超出负载上限 {self.load_ceiling}%，暂停提交任务")
+        elif usage < self.load_ceiling - LOAD_HYSTERESIS and self.limit < self.max_workers:
+            self.limit += 1
+            self.adjustments += 1
+            self.logger.info(f"{status}，并发任务数 {self.limit - 1} -> {self.limit}")
+
+
+def estimate_compress_memory(file_size: int, compression_algorithm: str, compression_level: int, chunk_size: int, parallel_threshold: int, block_workers: int, entry_format: str) -> int:
+    """估算压缩一个文件时的峰值内存占用，与 compress_file 的压缩方式对应
+
+    Args:
+        file_size: 文件大小
+        compression_algorithm: 压缩算法（auto 时取所有候选中的最大值）
+        compression_level: 压缩等级
+        chunk_size: 读取块大小
+        parallel_threshold: 分块并行压缩阈值（字节），0 表示禁用
+        block_workers: 分块并行压缩的线程数
+        entry_format: 归档条目格式（stored 或 native）
+
+    Returns:
+        int: 估算内存占用（字节）
+    """
+    if compression_algorithm == "auto":
+        return max(estimate_compress_memory(file_size, algorithm, level, chunk_size, parallel_threshold, block_workers, entry_format) for algorithm, level in AUTO_CANDIDATES)
+    
+    # 读取缓冲区和内存中的压缩输出
+    base = chunk_size + SPOOL_MAX_SIZE
+    large_file = block_workers > 1 and 0 < parallel_threshold <= file_size
+    native = entry_format == "native"
+    if compression_algorithm == "lzma":
+        dict_size = lzma_dict_size(file_size)
+        encoder = int(dict_size * LZMA_MEMORY_FACTORS[compression_level >= 4])
+        if large_file and not native:
+            # 每个分块线程各有一个编码器，并持有输入块和输出块
+            encoder = block_workers * (int(min(dict_size, LZMA_BLOCK_SIZE) * LZMA_MEMORY_FACTORS[compression_level >= 4]) + 2 * LZMA_BLOCK_SIZE)
+    elif compression_algorithm == "bzip2":
+        encoder = 8 * compression_level * BZIP2_BLOCK_UNIT + 400 * 1024
+        if large_file and not native:
+            encoder = block_workers * (encoder + 2 * compression_level * BZIP2_BLOCK_UNIT)
+    elif compression_algorithm == "zstd":
+        encoder = next(memory for max_level, memory in ZSTD_MEMORY_ESTIMATES if compression_level <= max_level)
+        if large_file:
+            encoder *= block_workers
+    elif compression_algorithm == "deflate":
+        encoder = DEFLATE_MEMORY
+        if large_file:
+            encoder = block_workers * (DEFLATE_MEMORY + 2 * DEFLATE_BLOCK_SIZE)
+    else:
+        encoder = 0
+    return base + encoder
+
+
+def plan_workers(file_sizes: List[int], settings: ArchiveSettings, logger: logging.Logger) -> int:
+    """根据估算的内存占用确定实际使用的工作线程数，并记录内存规划
+
+    同时压缩 n 个任务时每个大文件最多使用 工作线程数 // n 个线程分块并行压缩，按最坏情况估算：
+    对每种 n 取占用内存最多的 n 个文件之和，再取其中的最大值。设置了内存上限时，减少工作线程数
+    直到估算总内存不超过上限，至少保留一个工作线程。线程池大小另按文件数限制。
+
+    Args:
+        file_sizes: 各文件大小
+        settings: 归档设置
+        logger: 日志记录器
+
+    Returns:
+        int: 实际使用的工作线程数（所有任务的压缩线程总数上限）
+    """
+    def estimate_total(workers: int) -> int:
+        totals = [0]
+        for tasks in range(1, min(workers, len(file_sizes)) + 1):
+            estimates = sorted((estimate_compress_memory(file_size, settings.compression_algorithm, settings.compression_level, settings.chunk_size, settings.parallel_threshold, workers // tasks, settings.entry_format) for file_size in file_sizes), reverse=True)
+            totals.append(sum(estimates[:tasks]))
+        return max(totals)
+    
+    planned_workers = max(1, settings.max_workers)
+    workers = planned_workers
+    total = estimate_total(workers)
+    while settings.memory_limit > 0 and total > settings.memory_limit and workers > 1:
+        workers -= 1
+        total = estimate_total(workers)
+    
+    limit_text = format_size(settings.memory_limit) if settings.memory_limit > 0 else "不限制"
+    logger.info(f"内存规划: {workers} 个工作线程预计占用 {format_size(total)}，内存上限: {limit_text}")
+    if workers < planned_workers:
+        logger.warning(f"内存上限不足，工作线程数由 {settings.max_workers} 调整为 {workers}")
+    if settings.memory_limit > 0 and total > settings.memory_limit:
+        logger.warning(f"单个任务预计占用 {format_size(total)}，超出内存上限，可降低压缩等级或改用其他压缩算法")
+    return workers
+
+
+def estimate_compress_cost(file_size: int, compression_algorithm: str, compression_level: int) -> float:
+    """估算压缩一个文件的相对耗时：文件大小 × 压缩算法在该压缩等级下的系数
+
+    Args:
+        file_size: 文件大小
+        compression_algorithm: 压缩算法
+        compression_level: 压缩等级
+
+    Returns:
+        float: 相对耗时
+    """
+    factor = next((factor for max_level, factor in COST_FACTORS.get(compression_algorithm, []) if compression_level <= max_level), 1.0)
+    return file_size * factor
+
+
+def batch_small_files(files: List[str], file_sizes: dict, small_file_threshold: int, max_workers: int) -> List[List[str]]:
+    """将小于 small_file_threshold 的文件合并为批量任务，其余文件各自作为一个任务
+
+    小文件按大小从大到小轮流分配到各批次，使各批次的数据量接近。
+    批次数不少于 max_workers，每批最多 SMALL_BATCH_FILES 个文件。
+
+    Args:
+        files: 文件路径列表
+        file_sizes: 文件路径到文件大小的映射
+        small_file_threshold: 小文件合并阈值（字节），0 表示禁用
+        max_workers: 最大工作线程数
+
+    Returns:
+        List[List[str]]: 任务列表，每个任务为一组文件路径
+    """
+    small_files = [file_path for file_path in files if file_sizes[file_path] < small_file_threshold]
+    tasks = [[file_path] for file_path in files if file_sizes[file_path] >= small_file_threshold]
+    if len(small_files) < 2:
+        return tasks + [[file_path] for file_path in small_files]
+    
+    small_files.sort(key=lambda file_path: file_sizes[file_path], reverse=True)
+    batch_count = max(min(max_workers, len(small_files)), -(-len(small_files) // SMALL_BATCH_FILES))
+    return tasks + [small_files[index::batch_count] for index in range(batch_count)]
+
+
+def order_by_cost(tasks: List[List[str]], file_sizes: dict, compression_algorithm: str, compression_level: int, cost_model: Callable[[int, str, int], float] = estimate_compress_cost) -> List[List[str]]:
+    """按估算耗时从大到小排列任务（最长处理时间优先），避免大文件最后提交时拖长总耗时
+
+    Args:
+        tasks: 任务列表，每个任务为一组文件路径
+        file_sizes: 文件路径到文件大小的映射
+        compression_algorithm: 压缩算法
+        compression_level: 压缩等级
+        cost_model: 成本模型，参数为 (文件大小, 压缩算法, 压缩等级)
+
+    Returns:
+        List[List[str]]: 排序后的任务列表
+    """
+    return sorted(tasks, key=lambda task: sum(cost_model(file_sizes[file_path], compression_algorithm, compression_level) for file_path in task), reverse=True)
+
+
+def delete_archived_files(written_paths: List[str], logger: logging.Logger) -> None:
+    """删除已成功写入归档的原始文件
+
+    Args:
+        written_paths: 已写入归档的原始文件路径列表
+        logger: 日志记录器
+    """
+    deleted_count = 0
+    for file_path in written_paths:
+        if not os.path.exists(file_path):
+            continue
+        
+        try:
+            os.remove(file_path)
+            logger.debug(f"已删除原始文件: {os.path.basename(file_path)}")
+            deleted_count += 1
+        except Exception as e:
+            logger.error(f"删除文件 {file_path} 失败: {e}")
+    
+    logger.info(f"共删除 {deleted_count} 个原始文件")
+
+
+def create_archive_generic(files: List[str], archive_path: str, settings: ArchiveSettings, incremental_mode: bool, logger: logging.Logger, content_store: Optional[ContentStore] = None, cost_model: Callable[[int, str, int], float] = estimate_compress_cost) -> List[str]:
+    """使用指定压缩算法创建归档文件
+
+    压缩线程池与写入线程流水线运行：每个文件压缩完成后即通过有界队列交给写入线程写入归档。
+    任务以滑动窗口方式提交，同一时间最多有 max_in_flight 个任务在途。
+
+    Args:
+        files: 需要归档的文件路径列表
+        archive_path: 归档文件路径
+        settings: 归档设置
+        incremental_mode: 是否为增量模式
+        logger: 日志记录器
+        content_store: 内容去重使用的内容哈希库（可选）
+        cost_model: 任务排序使用的成本模型，参数为 (文件大小, 压缩算法, 压缩等级)
+
+    Returns:
+        List[str]: 已写入归档的原始文件路径列表
+    """
+    file_sizes = {}
+    for file_path in files:
+        try:
+            file_sizes[file_path] = os.path.getsize(file_path)
+        except OSError as e:
+            logger.error(f"读取文件 {file_path} 失败: {e}")
+    files = [file_path for file_path in files if file_path in file_sizes]
+    total_files = len(files)
+    
+    # 时间预算从这里开始计算，包括重建索引和计算哈希的时间
+    start_time = time.monotonic()
+    
+    zip_mode = "a" if incremental_mode and os.path.exists(archive_path) else "w"
+    existing_size = 0
+    existing_files = set()
+    index = None
+    
+    if incremental_mode and settings.archive_index:
+        try:
+            index = ArchiveIndex(archive_path)
+            if not index.is_synced():
+                logger.info("归档索引不存在或与归档文件不一致，重建索引")
+                index.rebuild()
+            existing_files = index
+            logger.debug(f"归档索引: {index.index_path}，条目数: {len(index)}")
+        except (sqlite3.Error, zipfile.BadZipFile, OSError) as e:
+            logger.warning(f"归档索引不可用，改为读取归档文件: {e}")
+            if index is not None:
+                index.close()
+            index = None
+    
+    writer = None
+    temp_dir = None
+    try:
+        if incremental_mode and os.path.exists(archive_path):
+            existing_size = os.path.getsize(archive_path)
+            logger.info(f"现有归档大小: {format_size(existing_size)}")
+        
+        if incremental_mode and os.path.exists(archive_path) and index is None:
+            # 检查ZIP文件中已存在的文件
+            try:
+                with zipfile.ZipFile(archive_path, "r") as zipf:
+                    for info in zipf.infolist():
+                        # 只处理文件，跳过目录
+                        if not info.filename.endswith('/'):
+                            existing_files.add(info.filename)
+            except Exception as e:
+                logger.error(f"读取现有归档文件失败: {e}")
+        
+        content_matches = []
+        if content_store is not None:
+            # 写入线程启动后不再读取当前归档的中央目录，核对记录时使用已知的条目集合
+            content_store.set_entries(os.path.basename(archive_path), existing_files)
+            # 写入线程启动前在主线程中查询，内容已归档的文件不再压缩
+            for file_path in files:
+                try:
+                    match = find_duplicate_content(file_path, file_sizes[file_path], archive_path, index, content_store, settings.chunk_size)
+                except OSError as e:
+                    # 无法读取的文件按新内容处理，交给压缩阶段报告错误
+                    logger.warning(f"计算文件 {file_path} 的哈希失败: {e}")
+                    match = None
+                if match is not None:
+                    content_matches.append((file_path, match))
+            if content_matches:
+                matched_paths = {file_path for file_path, _ in content_matches}
+                files = [file_path for file_path in files if file_path not in matched_paths]
+                file_sizes = {file_path: file_sizes[file_path] for file_path in files}
+                total_files = len(files)
+                logger.info(f"{len(content_matches)} 个文件的内容已归档，跳过压缩")
+        
+        delta_bases = {}
+        if index is not None and settings.append_delta and settings.duplicate_policy == "version":
+            for file_path in files:
+                try:
+                    delta = find_delta_base(file_path, file_sizes[file_path], index, settings.chunk_size)
+                except OSError as e:
+                    logger.warning(f"计算文件 {file_path} 的哈希失败: {e}")
+                    delta = None
+                if delta is not None:
+                    delta_bases[file_path] = delta
+                    # 之后的任务合并、排序和吞吐量统计按实际压缩的大小计算
+                    file_sizes[file_path] -= delta[1]
+            if delta_bases:
+                logger.info(f"{len(delta_bases)} 个文件在已归档版本之后追加了内容，只压缩追加的部分")
+        
+        # 内存规划和时间预算只计算去重和追加增量之后实际需要压缩的数据
+        max_workers = plan_workers(list(file_sizes.values()), settings, logger)
+        # 线程池大小不超过文件数；max_workers 是所有任务合计的压缩线程数，由 submit_next 分给各任务分块并行压缩
+        pool_workers = max(1, min(max_workers, total_files))
+        max_in_flight = settings.max_in_flight if settings.max_in_flight > 0 else pool_workers * IN_FLIGHT_FACTOR
+        use_process = settings.executor_type == "process"
+        logger.info(f"开始压缩 {total_files} 个文件，使用 {pool_workers} 个{'进程' if use_process else '线程'}")
+        logger.debug(f"最大在途任务数: {max_in_flight}")
+        
+        stats = {
+            "added": [],
+            "duplicates": [],
+            "deduplicated": [],
+            "deltas": [],
+            "written_paths": [],
+            "duplicate_archive_path": None,
+            "error": None
+        }
+        result_queue = queue.Queue(maxsize=WRITER_QUEUE_SIZE)
+        writer = threading.Thread(
+            target=archive_writer,
+            args=(result_queue, archive_path, zip_mode, existing_files, index, content_store, settings, stats, logger),
+            name="archive-writer",
+            daemon=True
+        )
+        writer.start()
+        for item in content_matches:
+            result_queue.put(item)
+        
+        # 多进程模式下压缩结果写入归档文件夹中的临时目录，只在进程间传递文件路径
+        temp_dir = tempfile.mkdtemp(prefix=".alas_tmp_", dir=os.path.dirname(os.path.abspath(archive_path))) if use_process else None
+        executor_class = ProcessPoolExecutor if use_process else ThreadPoolExecutor
+        compress_options = CompressOptions(
+            compression_algorithm=settings.compression_algorithm,
+            compression_level=settings.compression_level,
+            chunk_size=settings.chunk_size,
+            temp_dir=temp_dir,
+            parallel_threshold=settings.parallel_threshold,
+            block_workers=max_workers,
+            entry_format=settings.entry_format,
+            auto_tolerance=settings.auto_tolerance,
+            store_incompressible=settings.store_incompressible,
+            page_cache_hints=settings.page_cache_hints
+        )
+        planner = DeadlinePlanner(settings.compression_algorithm, settings.compression_level, settings.time_budget_seconds, max_workers, sum(file_sizes.values()), start_time, logger)
+        downgraded = []
+        if settings.time_budget_seconds > 0:
+            logger.info(f"时间预算: {settings.time_budget_seconds}秒，降级顺序: {' -> '.join(planner.describe(rung) for rung in range(len(planner.ladder)))}")
+        
+        throttle = LoadThrottle(settings.load_ceiling, pool_workers, logger)
+        if throttle.enabled:
+            logger.info(f"负载上限: {settings.load_ceiling}%")
+        
+        busy_time = 0.0
+        compress_start = time.monotonic()
+        with executor_class(max_workers=pool_workers) as executor:
+            tasks = batch_small_files(files, file_sizes, settings.small_file_threshold, pool_workers)
+            if len(tasks) < total_files:
+                logger.debug(f"已将小文件合并为批量任务，任务数: {len(tasks)}")
+            pending_tasks = collections.deque(order_by_cost(tasks, file_sizes, settings.compression_algorithm, settings.compression_level, cost_model))
+            futures = {}
+            
+            def submit_next() -> None:
+                # 补充任务直到在途任务数达到上限
+                while pending_tasks and len(futures) < throttle.window(max_in_flight):
+                    # 与该任务同时运行的任务都在在途或待提交的任务中，按二者之和均分线程，
+                    # 同时运行的 n 个任务各自不超过 max_workers // n 个分块线程，合计不超过 max_workers
+                    concurrent_tasks = min(pool_workers, len(futures) + len(pending_tasks))
+                    block_workers = max(1, max_workers // concurrent_tasks)
+                    task = pending_tasks.popleft()
+                    rung, algorithm, level = planner.choose()
+                    offsets = {file_path: delta_bases[file_path][1] for file_path in task if file_path in delta_bases}
+                    options = compress_options._replace(compression_algorithm=algorithm, compression_level=level, block_workers=block_workers)
+                    future = executor.submit(compress_batch, task, options, offsets)
+                    futures[future] = (task, rung)
+            
+            submit_next()
+            completed = 0
+            while futures or pending_tasks:
+                if not futures:
+                    # 暂停提交且没有在途任务，等待负载回落
+                    time.sleep(LOAD_SAMPLE_INTERVAL)
+                    throttle.sample()
+                    submit_next()
+                    continue
+                
+                # 启用负载调度时定时醒来采样
+                timeout = LOAD_SAMPLE_INTERVAL if throttle.enabled else None
+                done, _ = concurrent.futures.wait(futures, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+                
+                for future in done:
+                    task, rung = futures.pop(future)
+                    
+                    try:
+                        task_results = future.result()
+                    except Exception as e:
+                        task_results = [(file_path, e) for file_path in task]
+                    
+                    for file_path, result in task_results:
+                        if isinstance(result, Exception):
+                            planner.record(rung, file_sizes[file_path], None)
+                            logger.error(f"压缩文件 {file_path} 失败: {result}")
+                        else:
+                            busy_time += result.busy_time
+                            # 直接存储的文件耗时不代表压缩速度，不计入吞吐量
+                            planner.record(rung, file_sizes[file_path], result.busy_time if result.algorithm != "store" else None)
+                            if rung > 0 and result.algorithm != "store":
+                                downgraded.append((result.arcname, planner.describe(rung)))
+                            logger.debug(f"已压缩文件: {result.arcname}")
+                            if result.algorithm == "store":
+                                logger.info(f"文件不可压缩，直接存储: {result.arcname}")
+                            elif settings.compression_algorithm == "auto":
+                                logger.info(f"自动选择: {result.arcname} -> {result.algorithm.upper()}-{result.compression_level}，压缩率: {(1 - result.compressed_size / result.original_size) * 100 if result.original_size > 0 else 0:.2f}%")
+                            if file_path in delta_bases:
+                                delta_base, delta_offset, sha256 = delta_bases[file_path]
+                                result = result._replace(sha256=sha256, delta_base=delta_base, delta_offset=delta_offset)
+                            # 队列已满时阻塞，等待写入线程消费
+                            result_queue.put((file_path, result))
+                        
+                        completed += 1
+                        
+                        progress = (completed / total_files) * 100
+                        progress_line = f"\r压缩进度: {progress:.1f}% ({completed}/{total_files})"
+                        print(progress_line, end="", flush=True)
+                
+                throttle.sample()
+                submit_next()
+        compress_time = time.monotonic() - compress_start
+    finally:
+        if writer is not None:
+            result_queue.put(None)
+            writer.join()
+        if content_store is not None:
+            content_store.release_entries(os.path.basename(archive_path))
+        if index is not None:
+            index.close()
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    print("\r" + " " * 80 + "\r", end="", flush=True)
+    
+    if stats["error"] is not None:
+        # 出错前已写入归档的条目仍保留在归档中，对应的原始文件也需要删除，否则下次运行会再次归档
+        delete_archived_files(stats["written_paths"], logger)
+        raise stats["error"]
+    
+    if compress_time > 0:
+        # 并行效率：压缩线程 CPU 时间之和 / (压缩阶段耗时 × 压缩线程总数)
+        efficiency = busy_time / (compress_time * max_workers) * 100
+        logger.info(f"并行效率: {efficiency:.1f}%（压缩 CPU 时间合计 {busy_time:.2f}秒，压缩阶段 {compress_time:.2f}秒 × {max_workers} 个压缩线程）")
+    
+    if settings.load_ceiling > 0:
+        logger.info(f"负载调度: 调整 {throttle.adjustments} 次，暂停提交 {throttle.paused_time:.1f}秒")
+    
+    if settings.time_budget_seconds > 0:
+        # 时间预算报告
+        logger.info(f"时间预算: {settings.time_budget_seconds}秒，实际耗时: {time.monotonic() - start_time:.2f}秒，降级文件: {len(downgraded)} 个")
+        for arcname, setting in downgraded:
+            logger.info(f"  已降级: {arcname} -> {setting}")
+    
+    files_to_add = stats["added"]
+    if stats["duplicates"] and settings.duplicate_policy == "version":
+        logger.info(f"{len(stats['duplicates'])} 个重复文件已作为新版本写入归档")
+        for arcname, _, _ in stats["duplicates"]:
+            logger.debug(f"  新版本: {arcname}")
+    elif stats["duplicates"]:
+        logger.info(f"{len(stats['duplicates'])} 个重复文件已保存到新归档文件: {stats['duplicate_archive_path']}")
+    
+    if stats["deltas"]:
+        saved_size = sum(delta_offset for _, _, delta_offset in stats["deltas"])
+        logger.info(f"追加增量: {len(stats['deltas'])} 个文件只写入了追加的部分，节省原始数据 {format_size(saved_size)}")
+        for arcname, delta_base, _ in stats["deltas"]:
+            logger.debug(f"  {arcname} -> {delta_base}")
+    
+    if stats["deduplicated"]:
+        saved_size = sum(original_size for _, _, original_size in stats["deduplicated"])
+        skipped = sum(1 for arcname, target, _ in stats["deduplicated"] if get_base_name(split_reference(target)[1]) == arcname)
+        logger.info(f"内容去重: {len(stats['deduplicated'])} 个文件（跳过 {skipped} 个，引用 {len(stats['deduplicated']) - skipped} 个），节省原始数据 {format_size(saved_size)}")
+        for arcname, target, _ in stats["deduplicated"]:
+            logger.debug(f"  {arcname} -> {target}")
+    
+    elapsed_time = time.monotonic() - start_time
+    final_size = os.path.getsize(archive_path) if os.path.exists(archive_path) else 0
+    
+    if incremental_mode:
+        # 增量模式：只计算新添加文件的压缩率
+        added_original_size = sum(result[1] for result in files_to_add)
+        added_compressed_size = sum(result[2] for result in files_to_add)
+        compression_ratio = (1 - added_compressed_size / added_original_size) * 100 if added_original_size > 0 else 0
+        
+        if files_to_add:
+            logger.info(f"新增了 {len(files_to_add)} 个文件到增量归档")
+        logger.info(f"已完成归档，压缩耗时: {elapsed_time:.2f}秒，已保存到: {archive_path}")
+        logger.info(f"新增原始大小: {format_size(added_original_size)}，新增压缩大小: {format_size(added_compressed_size)}，压缩率: {compression_ratio:.2f}%")
+        logger.info(f"归档总大小: {format_size(final_size)}（增加了 {format_size(final_size - existing_size)}）")
+    else:
+        # 滚动模式：计算整体压缩率
+        original_size = sum(result[1] for result in files_to_add)
+        compression_ratio = (1 - final_size / original_size) * 100 if original_size > 0 else 0
+        logger.info(f"已完成归档，压缩耗时: {elapsed_time:.2f}秒，已保存到: {archive_path}")
+        logger.info(f"原始大小: {format_size(original_size)}，压缩后大小: {format_size(final_size)}，压缩率: {compression_ratio:.2f}%")
+    
+    delete_archived_files(stats["written_paths"], logger)
+    return stats["written_paths"]
+
+
+def solid_sort_key(file_path: str) -> Tuple[int, str, str, str]:
+    """固实归档的文件排序键：同一天的日志相邻，其次按配置名排序，使相似内容集中在压缩字典窗口内
+
+    Args:
+        file_path: 文件路径
+
+    Returns:
+        Tuple[int, str, str, str]: 排序键
+    """
+    filename = os.path.basename(file_path)
+    match = SOLID_DATE_PATTERN.match(filename)
+    if match:
+        return (0, match.group(1), os.path.splitext(match.group(2))[1], match.group(2))
+    # 非日期命名的文件按扩展名聚集，放在最后
+    return (1, "", os.path.splitext(filename)[1], filename)
+
+
+def create_solid_archive(files: List[str], archive_path: str, compression_algorithm: str, compression_level: int, chunk_size: int, page_cache_hints: bool, logger: logging.Logger) -> None:
+    """创建固实归档：所有文件按 solid_sort_key 排序后写入 tar 包，由一个压缩器整体流式压缩
+
+    无法打开的文件跳过；文件头写出后读取出错时 tar 数据流已损坏，删除归档并保留所有原始文件。
+
+    Args:
+        files: 需要归档的文件路径列表
+        archive_path: 归档文件路径
+        compression_algorithm: 压缩算法（lzma 或 bzip2）
+        compression_level: 压缩等级（1-9）
+        chunk_size: 读取块大小
+        page_cache_hints: 是否使用 posix_fadvise 页缓存提示
+        logger: 日志记录器
+    """
+    total_files = len(files)
+    logger.info(f"开始固实压缩 {total_files} 个文件")
+    
+    start_time = time.time()
+    written_paths = []
+    original_size = 0
+    
+    if compression_algorithm.lower() == "lzma":
+        lzma_filters = [
+            {"id": lzma.FILTER_LZMA2, "preset": compression_level, "dict_size": LZMA_DICT_SIZE}
+        ]
+        compressed_file = lzma.LZMAFile(archive_path, "w", filters=lzma_filters)
+    elif compression_algorithm.lower() == "bzip2":
+        compressed_file = bz2.BZ2File(archive_path, "w", compresslevel=compression_level)
+    elif compression_algorithm.lower() == "deflate":
+        compressed_file = gzip.GzipFile(archive_path, "wb", compresslevel=compression_level)
+    elif compression_algorithm.lower() == "zstd" and zstd is not None:
+        compressed_file = zstd.ZstdFile(archive_path, "w", level=compression_level)
+    else:
+        raise ValueError(f"不支持的压缩算法: {compression_algorithm}")
+    
+    try:
+        with compressed_file, tarfile.open(fileobj=compressed_file, mode="w|", bufsize=max(chunk_size, tarfile.RECORDSIZE)) as tar:
+            for index, file_path in enumerate(sorted(files, key=solid_sort_key), 1):
+                tar_offset = tar.offset
+                try:
+                    tar.add(file_path, arcname=os.path.basename(file_path), recursive=False)
+                    if page_cache_hints:
+                        drop_file_cache(file_path)
+                    original_size += tar.members[-1].size
+                    written_paths.append(file_path)
+                    logger.debug(f"已写入归档: {os.path.basename(file_path)}")
+                except OSError as e:
+                    if tar.offset != tar_offset:
+                        # 已写出文件头但数据不完整，tar 数据流无法回退，后续成员也无法正确读取
+                        raise
+                    logger.error(f"压缩文件 {file_path} 失败: {e}")
+                
+                progress = (index / total_files) * 100
+                print(f"\r压缩进度: {progress:.1f}% ({index}/{total_files})", end="", flush=True)
+    except Exception:
+        print("\r" + " " * 80 + "\r", end="", flush=True)
+        # 丢弃不完整的归档，原始文件均保留
+        if os.path.exists(archive_path):
+            os.remove(archive_path)
+        raise
+    
+    print("\r" + " " * 80 + "\r", end="", flush=True)
+    if page_cache_hints:
+        drop_file_cache(archive_path, sync=True)
+    
+    elapsed_time = time.time() - start_time
+    final_size = os.path.getsize(archive_path)
+    compression_ratio = (1 - final_size / original_size) * 100 if original_size > 0 else 0
+    logger.info(f"已完成归档，压缩耗时: {elapsed_time:.2f}秒，已保存到: {archive_path}")
+    logger.info(f"原始大小: {format_size(original_size)}，压缩后大小: {format_size(final_size)}，压缩率: {compression_ratio:.2f}%")
+    
+    deleted_count = 0
+    for file_path in written_paths:
+        try:
+            os.remove(file_path)
+            logger.debug(f"已删除原始文件: {os.path.basename(file_path)}")
+            deleted_count += 1
+        except Exception as e:
+            logger.error(f"删除文件 {file_path} 失败: {e}")
+    
+    logger.info(f"共删除 {deleted_count} 个原始文件")
+
+
+def get_log_date(file_path: str) -> str:
+    """获取日志文件的日期：优先使用文件名中的日期，否则使用修改日期
+
+    Args:
+        file_path: 文件路径
+
+    Returns:
+        str: 日期（YYYY-MM-DD）
+    """
+    match = SOLID_DATE_PATTERN.match(os.path.basename(file_path))
+    if match:
+        return match.group(1)
+    return datetime.fromtimestamp(os.path.getmtime(file_path)).strftime("%Y-%m-%d")
+
+
+class ShardCatalog:
+    """分片目录
+
+    以 SQLite 数据库记录增量归档的各个分片及其包含的日志日期，
+    选择分片时只需查询目录和检查当前分片，与历史分片数量无关。
+    """
+    
+    def __init__(self, catalog_path: str):
+        self.catalog_path = catalog_path
+        self.connection = sqlite3.connect(catalog_path)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS shards (
+                name TEXT PRIMARY KEY,
+                period TEXT NOT NULL,
+                sequence INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS log_dates (
+                log_date TEXT NOT NULL,
+                shard TEXT NOT NULL,
+                PRIMARY KEY (log_date, shard)
+            );
+        """)
+    
+    def latest_sequence(self, period_key: str) -> int:
+        """返回该周期已记录的最大分片序号，没有记录时为 1"""
+        row = self.connection.execute("SELECT MAX(sequence) FROM shards WHERE period = ?", (period_key,)).fetchone()
+        return row[0] or 1
+    
+    def shards_for_date(self, log_date: str) -> List[str]:
+        """返回包含该日期日志的分片文件名列表，按周期和序号排序"""
+        rows = self.connection.execute(
+            "SELECT log_dates.shard FROM log_dates JOIN shards ON shards.name = log_dates.shard WHERE log_date = ? ORDER BY shards.period, shards.sequence",
+            (log_date,)
+        ).fetchall()
+        return [row[0] for row in rows]
+    
+    def record(self, shard_name: str, period_key: str, sequence: int, log_dates: set) -> None:
+        """记录分片及其新增的日志日期
+
+        Args:
+            shard_name: 分片文件名
+            period_key: 分片周期（如 2026-10），不按周期分片时为空字符串
+            sequence: 分片序号
+            log_dates: 本次写入该分片的日志日期集合
+        """
+        with self.connection:
+            self.connection.execute("INSERT OR IGNORE INTO shards VALUES (?, ?, ?)", (shard_name, period_key, sequence))
+            self.connection.executemany("INSERT OR IGNORE INTO log_dates VALUES (?, ?)", ((log_date, shard_name) for log_date in log_dates))
+    
+    def close(self) -> None:
+        """关闭分片目录"""
+        self.connection.close()
+
+
+def get_shard_path(archive_folder: str, archive_base_name: str, period_key: str, sequence: int) -> str:
+    """生成分片路径：归档文件名_周期_序号.zip，周期为空或序号为 1 时省略对应部分
+
+    Args:
+        archive_folder: 归档文件夹路径
+        archive_base_name: 归档文件名（不含扩展名）
+        period_key: 分片周期
+        sequence: 分片序号
+
+    Returns:
+        str: 分片路径
+    """
+    parts = [archive_base_name]
+    if period_key:
+        parts.append(period_key)
+    if sequence > 1:
+        parts.append(str(sequence))
+    return os.path.join(archive_folder, "_".join(parts) + ".zip")
+
+
+def get_shard_usage(shard_path: str) -> Tuple[int, int]:
+    """返回分片当前的大小和条目数，条目数只读取 ZIP 结束记录
+
+    Args:
+        shard_path: 分片路径
+
+    Returns:
+        Tuple[int, int]: (大小, 条目数)，分片不存在时为 (0, 0)
+    """
+    if not os.path.exists(shard_path):
+        return 0, 0
+    size = os.path.getsize(shard_path)
+    try:
+        with open(shard_path, "rb") as f:
+            return size, read_zip_end_record(f)[2]
+    except zipfile.BadZipFile:
+        return size, 0
+
+
+def plan_shards(files: List[str], file_dates: dict, archive_folder: str, archive_base_name: str, shard_period: str, shard_max_size: int, shard_max_entries: int, catalog: ShardCatalog) -> List[Tuple[str, str, int, List[str]]]:
+    """按日志日期所属周期分组，并把每组文件依次分配到分片
+
+    从分片目录记录的最大序号开始，跳过磁盘上已有更新序号的分片。按日期顺序把文件加入当前分片，
+    累计条目数或估算大小（原始大小 × SHARD_SIZE_RATIO）将超出上限时切换到下一个分片，
+    一次写入大量文件时也不会超出上限。单个文件的估算大小超过上限时独占一个分片。
+
+    Args:
+        files: 需要归档的文件路径列表
+        file_dates: 文件路径到日志日期的映射
+        archive_folder: 归档文件夹路径
+        archive_base_name: 归档文件名（不含扩展名）
+        shard_period: 分片周期（none、monthly 或 yearly）
+        shard_max_size: 分片大小上限（字节），0 表示不限制
+        shard_max_entries: 分片条目数上限，0 表示不限制
+        catalog: 分片目录
+
+    Returns:
+        List[Tuple[str, str, int, List[str]]]: (分片路径, 分片周期, 分片序号, 文件列表) 列表，按周期排序
+    """
+    key_length = SHARD_PERIODS[shard_period]
+    groups = collections.defaultdict(list)
+    for file_path in files:
+        groups[file_dates[file_path][:key_length]].append(file_path)
+    
+    plan = []
+    for period_key in sorted(groups):
+        sequence = catalog.latest_sequence(period_key)
+        while os.path.exists(get_shard_path(archive_folder, archive_base_name, period_key, sequence + 1)):
+            sequence += 1
+        size, entries = get_shard_usage(get_shard_path(archive_folder, archive_base_name, period_key, sequence))
+        shard_files = []
+        for file_path in sorted(groups[period_key], key=lambda path: (file_dates[path], path)):
+            estimate = int(os.path.getsize(file_path) * SHARD_SIZE_RATIO)
+            full = 0 < shard_max_entries <= entries or (shard_max_size > 0 and entries > 0 and size + estimate > shard_max_size)
+            if full:
+                if shard_files:
+                    plan.append((get_shard_path(archive_folder, archive_base_name, period_key, sequence), period_key, sequence, shard_files))
+                sequence += 1
+                size, entries = get_shard_usage(get_shard_path(archive_folder, archive_base_name, period_key, sequence))
+                shard_files = []
+            shard_files.append(file_path)
+            size += estimate
+            entries += 1
+        if shard_files:
+            plan.append((get_shard_path(archive_folder, archive_base_name, period_key, sequence), period_key, sequence, shard_files))
+    return plan
+
+
+def extract_files(names: List[str], archive_folder: str, archive_name_format: str, output_folder: str, chunk_size: int, logger: logging.Logger) -> int:
+    """从增量归档中解压文件，还原追加增量和引用条目
+
+    文件名不带版本序号时解压最新版本（如 文件名;3），保存时去掉版本序号。
+    存在分片目录时通过日志日期找到包含该文件的分片，从序号最大的分片开始查找。
+
+    Args:
+        names: 文件名列表（可带版本序号）
+        archive_folder: 归档文件夹路径
+        archive_name_format: 归档文件名
+        output_folder: 输出文件夹路径
+        chunk_size: 块大小
+        logger: 日志记录器
+
+    Returns:
+        int: 成功解压的文件数
+    """
+    archive_base_name = archive_name_format[:-4] if archive_name_format.endswith(".zip") else archive_name_format
+    catalog_path = os.path.join(archive_folder, archive_base_name + CATALOG_SUFFIX)
+    catalog = ShardCatalog(catalog_path) if os.path.exists(catalog_path) else None
+    os.makedirs(output_folder, exist_ok=True)
+    extracted = 0
+    
+    try:
+        for name in names:
+            candidates = [os.path.join(archive_folder, archive_base_name + ".zip")]
+            match = SOLID_DATE_PATTERN.match(name)
+            if catalog is not None and match:
+                candidates += [os.path.join(archive_folder, shard) for shard in catalog.shards_for_date(match.group(1))]
+            
+            for archive_path in reversed(candidates):
+                if not os.path.exists(archive_path):
+                    continue
+                with zipfile.ZipFile(archive_path, "r") as zipf:
+                    entry = get_latest_version(name, set(zipf.namelist()))
+                    if entry is None:
+                        continue
+                    output_path = os.path.join(output_folder, get_base_name(name))
+                    with open(output_path, "wb") as output:
+                        size = extract_entry(zipf, entry, output, chunk_size)
+                logger.info(f"已解压: {os.path.basename(archive_path)}/{entry} -> {output_path}（{format_size(size)}）")
+                extracted += 1
+                break
+            else:
+                logger.error(f"归档中没有找到文件: {name}")
+    finally:
+        if catalog is not None:
+            catalog.close()
+    
+    return extracted
+
+
+def create_archive(files: List[str], archive_folder: str, archive_name_format: str, settings: ArchiveSettings, logger: logging.Logger, cost_model: Callable[[int, str, int], float] = estimate_compress_cost) -> None:
+    """创建归档文件
+
+    增量模式下设置了分片时，由 plan_shards 按日志日期和分片上限把文件分配到各个分片，
+    逐个分片追加，并在分片目录中记录日志日期与分片的对应关系。各分片共用时间预算，
+    每个分片使用开始时剩余的时间（至少 1 秒）。
+    增量模式下启用 content_dedup 时，各分片共用归档文件夹中的内容哈希库（<归档文件名>.content.db）。
+
+    Args:
+        files: 需要归档的文件路径列表
+        archive_folder: 归档文件夹路径
+        archive_name_format: 归档文件名格式（可选包含 {date} 占位符，可选包含 .zip 扩展名）
+        settings: 归档设置
+        logger: 日志记录器
+        cost_model: 任务排序使用的成本模型，参数为 (文件大小, 压缩算法, 压缩等级)
+    """
+    if not files:
+        logger.info("没有文件需要归档")
+        return
+    
+    if not os.path.exists(archive_folder):
+        os.makedirs(archive_folder)
+        logger.info(f"创建归档文件夹: {archive_folder}")
+    
+    archive_date = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+    incremental_mode = settings.archive_mode == "incremental"
+    solid_mode = settings.archive_format == "solid"
+    
+    if solid_mode and incremental_mode:
+        logger.warning("固实归档无法追加文件，增量模式将按滚动模式创建新归档")
+        incremental_mode = False
+    
+    if solid_mode and settings.time_budget_seconds > 0:
+        logger.warning("固实归档不支持时间预算，将忽略 time_budget_seconds")
+    
+    if solid_mode and settings.compression_algorithm == "auto":
+        logger.warning("固实归档只能使用一种压缩算法，自动选择将使用 LZMA")
+        settings = settings._replace(compression_algorithm="lzma")
+    
+    # 处理扩展名：固实归档使用对应压缩算法的 tar 扩展名
+    archive_ext = SOLID_EXTENSIONS[settings.compression_algorithm.lower()] if solid_mode else ".zip"
+    archive_base_name = archive_name_format
+    if archive_base_name.endswith(".zip"):
+        archive_base_name = archive_base_name[:-4]
+    
+    # 处理文件名
+    sharding = incremental_mode and (settings.shard_period != "none" or settings.shard_max_size > 0 or settings.shard_max_entries > 0)
+    if sharding:
+        catalog = ShardCatalog(os.path.join(archive_folder, archive_base_name + CATALOG_SUFFIX))
+        file_dates = {file_path: get_log_date(file_path) for file_path in files}
+        shard_plan = plan_shards(files, file_dates, archive_folder, archive_base_name, settings.shard_period, settings.shard_max_size, settings.shard_max_entries, catalog)
+        for shard_path, _, _, shard_files in shard_plan:
+            dates = sorted({file_dates[file_path] for file_path in shard_files})
+            state = "追加到现有分片" if os.path.exists(shard_path) else "创建新分片"
+            logger.info(f"增量模式：{state}: {os.path.basename(shard_path)}（{dates[0]} ~ {dates[-1]}，{len(shard_files)} 个文件）")
+    elif incremental_mode:
+        # 增量模式：直接使用提供的文件名，不添加日期前缀
+        archive_filename = archive_base_name + archive_ext
+        archive_path = os.path.join(archive_folder, archive_filename)
+        
+        if os.path.exists(archive_path):
+            logger.info(f"增量模式：追加到现有归档文件: {archive_filename}")
+        else:
+            logger.info(f"增量模式：创建新归档文件: {archive_filename}")
+    else:  # scroll 模式
+        # 滚动模式：使用年-月-日作为前缀
+        # 检查是否包含 {date} 占位符
+        if "{date}" in archive_base_name:
+            name_without_ext = archive_base_name.replace("{date}", archive_date)
+        else:
+            # 如果不包含 {date} 占位符，在文件名前添加日期前缀
+            name_without_ext = f"{archive_date}_{archive_base_name}"
+        
+        archive_filename = name_without_ext + archive_ext
+        archive_path = os.path.join(archive_folder, archive_filename)
+        
+        # 处理文件已存在的情况
+        counter = 0
+        while os.path.exists(archive_path):
+            counter += 1
+            archive_filename = f"{name_without_ext}_{counter}{archive_ext}"
+            archive_path = os.path.join(archive_folder, archive_filename)
+        
+        if counter > 1:
+            logger.info(f"检测到已有归档文件，将创建: {archive_filename}")
+        else:
+            logger.info(f"创建新归档文件: {archive_filename}")
+    
+    if solid_mode:
+        logger.info(f"使用压缩算法: {settings.compression_algorithm.upper()}，压缩等级: {settings.compression_level}，固实归档")
+    elif settings.compression_algorithm == "auto":
+        logger.info(f"使用压缩算法: 自动选择（容差 {settings.auto_tolerance}%），条目格式: {settings.entry_format}")
+    else:
+        logger.info(f"使用压缩算法: {settings.compression_algorithm.upper()}，压缩等级: {settings.compression_level}，条目格式: {settings.entry_format}")
+    
+    content_store = None
+    try:
+        if solid_mode:
+            create_solid_archive(files, archive_path, settings.compression_algorithm, settings.compression_level, settings.chunk_size, settings.page_cache_hints, logger)
+            return
+        if incremental_mode and settings.content_dedup:
+            content_store = ContentStore(os.path.join(archive_folder, archive_base_name + CONTENT_STORE_SUFFIX))
+        if sharding:
+            # 各分片共用同一个时间预算，每个分片只能使用剩余的时间
+            deadline = time.monotonic() + settings.time_budget_seconds
+            try:
+                for shard_path, period_key, sequence, shard_files in shard_plan:
+                    shard_budget = max(1, math.ceil(deadline - time.monotonic())) if settings.time_budget_seconds > 0 else 0
+                    written_paths = create_archive_generic(shard_files, shard_path, settings._replace(time_budget_seconds=shard_budget), incremental_mode, logger, content_store, cost_model)
+                    catalog.record(os.path.basename(shard_path), period_key, sequence, {file_dates[file_path] for file_path in written_paths})
+            finally:
+                catalog.close()
+            return
+        create_archive_generic(files, archive_path, settings, incremental_mode, logger, content_store, cost_model)
+    except Exception as e:
+        logger.error(f"创建归档文件失败: {e}")
+        raise
+    finally:
+        if content_store is not None:
+            content_store.close()
+
+
+def validate_compression_level(level: int, algorithm: str = DEFAULT_COMPRESSION_ALGORITHM) -> bool:
+    """验证压缩等级是否有效
+
+    Args:
+        level: 压缩等级
+        algorithm: 压缩算法
+
+    Returns:
+        bool: 是否有效
+    """
+    if algorithm.lower() == "zstd":
+        return 1 <= level <= ZSTD_MAX_LEVEL
+    if algorithm.lower() == "auto":
+        # 自动选择时忽略压缩等级
+        return True
+    return 1 <= level <= 9
+
+
+def validate_compression_algorithm(algorithm: str) -> bool:
+    """验证压缩算法是否有效
+
+    Args:
+        algorithm: 压缩算法
+
+    Returns:
+        bool: 是否有效
+    """
+    if algorithm.lower() == "zstd":
+        return zstd is not None
+    return algorithm.lower() in ["lzma", "bzip2", "deflate", "auto"]
+
+
+def validate_archive_format(archive_format: str) -> bool:
+    """验证归档格式是否有效
+
+    Args:
+        archive_format: 归档格式
+
+    Returns:
+        bool: 是否有效
+    """
+    return archive_format.lower() in ["zip", "solid"]
+
+
+def validate_entry_format(entry_format: str) -> bool:
+    """验证归档条目格式是否有效
+
+    Args:
+        entry_format: 归档条目格式
+
+    Returns:
+        bool: 是否有效
+    """
+    return entry_format.lower() in ["stored", "native"]
+
+
+def parse_cpu_list(cpu_list: str) -> set:
+    """解析 CPU 核心列表，如 "0,2-3"
+
+    Args:
+        cpu_list: CPU 核心列表，空字符串表示不限制
+
+    Returns:
+        set: CPU 核心编号集合，不限制时为空集合
+
+    Raises:
+        ValueError: 格式无效
+    """
+    cpus = set()
+    for part in cpu_list.replace(" ", "").split(","):
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            if int(start) > int(end):
+                raise ValueError(f"无效的 CPU 范围: {part}")
+            cpus.update(range(int(start), int(end) + 1))
+        else:
+            cpus.add(int(part))
+    if any(cpu < 0 for cpu in cpus):
+        raise ValueError(f"无效的 CPU 编号: {cpu_list}")
+    return cpus
+
+
+def set_io_priority_lowest() -> bool:
+    """将当前进程的 I/O 优先级设为 best-effort 类的最低级别（Linux ioprio_set 系统调用）
+
+    Returns:
+        bool: 是否设置成功
+    """
+    syscall_number = IOPRIO_SET_SYSCALLS.get(platform.machine().lower())
+    if not sys.platform.startswith("linux") or syscall_number is None:
+        return False
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        ioprio = (IOPRIO_CLASS_BE << IOPRIO_CLASS_SHIFT) | IOPRIO_LOWEST_LEVEL
+        return libc.syscall(syscall_number, IOPRIO_WHO_PROCESS, 0, ioprio) == 0
+    except (OSError, AttributeError):
+        return False
+
+
+def get_windows_process() -> Tuple[object, int]:
+    """获取 kernel32 和当前进程句柄，并声明用到的 Windows API 的参数类型
+
+    Returns:
+        Tuple[object, int]: (kernel32, 当前进程伪句柄)
+    """
+    kernel32 = ctypes.windll.kernel32
+    kernel32.GetCurrentProcess.restype = ctypes.c_void_p
+    kernel32.SetPriorityClass.argtypes = [ctypes.c_void_p, ctypes.c_uint32]
+    kernel32.SetProcessAffinityMask.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+    return kernel32, kernel32.GetCurrentProcess()
+
+
+def apply_scheduling(background: bool, cpu_set: set, max_workers: int, logger: logging.Logger) -> int:
+    """应用后台模式和 CPU 亲和性设置，并记录实际生效的调度设置
+
+    Linux / macOS 使用 os.nice 降低 CPU 优先级，Linux 额外通过 ioprio_set 降低 I/O 优先级，
+    Windows 使用后台处理模式同时降低 CPU 和 I/O 优先级。CPU 亲和性在 Linux 上使用
+    os.sched_setaffinity，在 Windows 上使用 SetProcessAffinityMask。
+
+    Args:
+        background: 是否启用后台模式
+        cpu_set: 绑定的 CPU 核心编号集合，空集合表示不限制
+        max_workers: 配置的最大工作线程数
+        logger: 日志记录器
+
+    Returns:
+        int: 不超过绑定核心数的最大工作线程数
+    """
+    settings = []
+    if background:
+        if hasattr(os, "nice"):
+            try:
+                settings.append(f"nice: {os.nice(BACKGROUND_NICE)}")
+            except OSError as e:
+                logger.warning(f"降低 CPU 优先级失败: {e}")
+            if set_io_priority_lowest():
+                settings.append(f"I/O 优先级: best-effort {IOPRIO_LOWEST_LEVEL}")
+            else:
+                logger.warning("当前系统不支持设置 I/O 优先级")
+        elif sys.platform == "win32":
+            kernel32, process = get_windows_process()
+            if kernel32.SetPriorityClass(process, WINDOWS_PROCESS_MODE_BACKGROUND_BEGIN):
+                settings.append("Windows 后台处理模式（低 CPU 和 I/O 优先级）")
+            elif kernel32.SetPriorityClass(process, WINDOWS_BELOW_NORMAL_PRIORITY_CLASS):
+                settings.append("优先级: 低于正常")
+            else:
+                logger.warning("降低进程优先级失败")
+    
+    if cpu_set:
+        try:
+            if hasattr(os, "sched_setaffinity"):
+                os.sched_setaffinity(0, cpu_set)
+                cpu_set = os.sched_getaffinity(0)
+            elif sys.platform == "win32":
+                kernel32, process = get_windows_process()
+                if not kernel32.SetProcessAffinityMask(process, sum(1 << cpu for cpu in cpu_set)):
+                    raise OSError("SetProcessAffinityMask 调用失败")
+            else:
+                raise OSError("当前系统不支持设置 CPU 亲和性")
+            settings.append(f"CPU 亲和性: {','.join(str(cpu) for cpu in sorted(cpu_set))}")
+            if max_workers > len(cpu_set):
+                logger.info(f"最大工作线程数由 {max_workers} 调整为绑定的核心数 {len(cpu_set)}")
+                max_workers = len(cpu_set)
+        except (OSError, ValueError) as e:
+            logger.warning(f"设置 CPU 亲和性失败: {e}")
+    
+    logger.info(f"调度设置: {'，'.join(settings) if settings else '未生效'}")
+    return max_workers
+
+
+def validate_executor(executor_type: str) -> bool:
+    """验证压缩执行方式是否有效
+
+    Args:
+        executor_type: 压缩执行方式
+
+    Returns:
+        bool: 是否有效
+    """
+    return executor_type.lower() in ["thread", "process"]
+
+
+def validate_archive_mode(mode: str) -> bool:
+    """验证归档模式是否有效
+
+    Args:
+        mode: 归档模式
+
+    Returns:
+        bool: 是否有效
+    """
+    return mode.lower() in ["scroll", "incremental"]
+
+
+def validate_duplicate_policy(policy: str) -> bool:
+    """验证重复文件处理方式是否有效
+
+    Args:
+        policy: 重复文件处理方式
+
+    Returns:
+        bool: 是否有效
+    """
+    return policy.lower() in ["version", "archive"]
+
+
+def validate_shard_period(period: str) -> bool:
+    """验证分片周期是否有效
+
+    Args:
+        period: 分片周期
+
+    Returns:
+        bool: 是否有效
+    """
+    return period.lower() in SHARD_PERIODS
+
+
+def parse_command_line_args() -> argparse.Namespace:
+    """解析命令行参数
+
+    Returns:
+        argparse.Namespace: 解析后的命令行参数
+    """
+    parser = argparse.ArgumentParser(description="ALAS 日志归档工具")
+    parser.add_argument("-n", "--name", help="归档文件名")
+    parser.add_argument("-t", "--target", help="目标文件夹路径")
+    parser.add_argument("-a", "--archive", help="归档文件夹路径")
+    parser.add_argument("-m", "--mode", help="归档模式", choices=["scroll", "incremental"])
+    parser.add_argument("-c", "--compression", help="压缩算法", choices=["lzma", "bzip2", "zstd", "deflate", "auto"])
+    parser.add_argument("-l", "--level", help="压缩等级（zstd 为 1-22）", type=int, choices=range(1, ZSTD_MAX_LEVEL + 1), metavar="1-22")
+    parser.add_argument("-w", "--workers", help="多线程设置", type=int)
+    parser.add_argument("-e", "--executor", help="压缩执行方式", choices=["thread", "process"])
+    parser.add_argument("-L", "--save-logs", help="日志文件输出控制", choices=["true", "false"])
+    parser.add_argument("-b", "--background", help="后台模式（降低 CPU 和 I/O 优先级）", choices=["true", "false"])
+    parser.add_argument("-x", "--extract", help="从增量归档中解压文件（还原追加增量，默认为最新版本）", nargs="+", metavar="FILE")
+    parser.add_argument("-o", "--output", help="解压输出文件夹路径（默认为当前文件夹）")
+    return parser.parse_args()
+
+
+def main():
+    """主函数"""
+    args = parse_command_line_args()
+    
+    print_info()
+    
+    config = load_config(CONFIG_FILE)
+    log_folder = config.get("log_folder", "logs")
+    max_log_files = config.get("max_log_files", 15)
+    log_level = config.get("log_level", logging.INFO)
+    save_logs = config.get("save_logs", True)
+    
+    # 命令行参数覆盖配置文件
     if args.save_logs:
         save_logs = args.save_logs.lower() == "true"
     
@@ -746,26 +3457,96 @@ def main():
         archive_name_format = args.name if args.name else config.get("archive_name_format", "{date}_归档.zip")
         compression_algorithm = args.compression if args.compression else config.get("compression_algorithm", DEFAULT_COMPRESSION_ALGORITHM)
         compression_level = args.level if args.level else config.get("compression_level", 9)
+        auto_tolerance = config.get("auto_tolerance", AUTO_TOLERANCE)
+        store_incompressible = config.get("store_incompressible", True)
+        archive_format = config.get("archive_format", DEFAULT_ARCHIVE_FORMAT)
+        entry_format = config.get("entry_format", DEFAULT_ENTRY_FORMAT)
         archive_mode = args.mode if args.mode else config.get("archive_mode", "overwrite")
         max_workers = args.workers if args.workers else config.get("max_workers", MAX_WORKERS)
+        max_in_flight = config.get("max_in_flight", 0)
+        executor_type = args.executor if args.executor else config.get("executor", DEFAULT_EXECUTOR)
         chunk_size = config.get("chunk_size", CHUNK_SIZE)
+        parallel_threshold = config.get("parallel_threshold", PARALLEL_THRESHOLD)
+        small_file_threshold = config.get("small_file_threshold", SMALL_FILE_THRESHOLD)
+        memory_limit = config.get("memory_limit", 0) * 1024 * 1024
+        page_cache_hints = config.get("page_cache_hints", True)
+        background = args.background.lower() == "true" if args.background else config.get("background", False)
+        cpu_affinity = config.get("cpu_affinity", "")
+        load_ceiling = config.get("load_ceiling", 0)
+        archive_index = config.get("archive_index", True)
+        content_dedup = config.get("content_dedup", False)
+        append_delta = config.get("append_delta", False)
+        duplicate_policy = config.get("duplicate_policy", DEFAULT_DUPLICATE_POLICY)
+        shard_period = config.get("shard_period", "none")
+        shard_max_size = config.get("shard_max_size", 0) * 1024 * 1024
+        shard_max_entries = config.get("shard_max_entries", 0)
+        time_budget_seconds = config.get("time_budget_seconds", 0)
         current_date = datetime.now().strftime("%Y-%m-%d")
         
         if not validate_compression_algorithm(compression_algorithm):
-            logger.error(f"不支持的压缩算法: {compression_algorithm}")
+            if compression_algorithm.lower() == "zstd":
+                logger.error("zstd 压缩算法需要 Python 3.14 或更高版本")
+            else:
+                logger.error(f"不支持的压缩算法: {compression_algorithm}")
             sys.exit(1)
         
-        if not validate_compression_level(compression_level):
+        if not validate_compression_level(compression_level, compression_algorithm):
             logger.error(f"无效的压缩等级: {compression_level}")
             sys.exit(1)
         
+        if auto_tolerance < 0:
+            logger.error(f"无效的自动选择容差: {auto_tolerance}")
+            sys.exit(1)
+        
+        if not validate_archive_format(archive_format):
+            logger.error(f"无效的归档格式: {archive_format}")
+            sys.exit(1)
+        
+        if not validate_entry_format(entry_format):
+            logger.error(f"无效的归档条目格式: {entry_format}")
+            sys.exit(1)
+        
         if not validate_archive_mode(archive_mode):
             logger.error(f"无效的归档模式: {archive_mode}")
             sys.exit(1)
         
+        if not validate_duplicate_policy(duplicate_policy):
+            logger.error(f"无效的重复文件处理方式: {duplicate_policy}")
+            sys.exit(1)
+        
+        if not validate_shard_period(shard_period):
+            logger.error(f"无效的分片周期: {shard_period}")
+            sys.exit(1)
+        
+        if shard_max_size < 0 or shard_max_entries < 0:
+            logger.error(f"无效的分片上限: {shard_max_size // 1024 // 1024} MB，{shard_max_entries} 个条目")
+            sys.exit(1)
+        
         if max_workers < 1:
             logger.error(f"无效的工作线程数: {max_workers}")
             sys.exit(1)
+        
+        if not validate_executor(executor_type):
+            logger.error(f"无效的压缩执行方式: {executor_type}")
+            sys.exit(1)
+        
+        if time_budget_seconds < 0:
+            logger.error(f"无效的时间预算: {time_budget_seconds}")
+            sys.exit(1)
+        
+        if max_in_flight < 0:
+            logger.error(f"无效的最大在途任务数: {max_in_flight}")
+            sys.exit(1)
+        
+        if not 0 <= load_ceiling <= 100:
+            logger.error(f"无效的负载上限: {load_ceiling}")
+            sys.exit(1)
+        
+        try:
+            cpu_set = parse_cpu_list(cpu_affinity)
+        except ValueError:
+            logger.error(f"无效的 CPU 亲和性设置: {cpu_affinity}")
+            sys.exit(1)
 
         if not save_logs:
             logger.warning("日志仅控制台输出")
@@ -774,14 +3555,50 @@ def main():
         logger.info(f"目标文件夹: {target_folder}")
         logger.info(f"归档文件夹: {archive_folder}")
         
+        if args.extract:
+            extracted = extract_files(args.extract, archive_folder, archive_name_format, args.output or os.getcwd(), chunk_size, logger)
+            if extracted < len(args.extract):
+                sys.exit(1)
+            return
+        
         mode_display = "增量" if archive_mode == "incremental" else "滚动"
         logger.info(f"归档模式: {mode_display}")
         
+        # 在创建线程池之前设置，之后创建的线程和进程都会继承
+        if background or cpu_set:
+            max_workers = apply_scheduling(background, cpu_set, max_workers, logger)
+        
         delete_gui_files(target_folder, current_date, logger)
         delete_error_folder(target_folder, logger)
         
+        settings = ArchiveSettings(
+            compression_algorithm=compression_algorithm,
+            compression_level=compression_level,
+            auto_tolerance=auto_tolerance,
+            store_incompressible=store_incompressible,
+            archive_format=archive_format,
+            entry_format=entry_format,
+            archive_mode=archive_mode,
+            max_workers=max_workers,
+            max_in_flight=max_in_flight,
+            executor_type=executor_type,
+            chunk_size=chunk_size,
+            parallel_threshold=parallel_threshold,
+            small_file_threshold=small_file_threshold,
+            memory_limit=memory_limit,
+            page_cache_hints=page_cache_hints,
+            load_ceiling=load_ceiling,
+            archive_index=archive_index,
+            duplicate_policy=duplicate_policy,
+            content_dedup=content_dedup,
+            append_delta=append_delta,
+            shard_period=shard_period,
+            shard_max_size=shard_max_size,
+            shard_max_entries=shard_max_entries,
+            time_budget_seconds=time_budget_seconds
+        )
         files_to_archive = get_files_to_archive(target_folder, current_date, logger)
-        create_archive(files_to_archive, archive_folder, archive_name_format, compression_algorithm, compression_level, archive_mode, max_workers, chunk_size, logger)
+        create_archive(files_to_archive, archive_folder, archive_name_format, settings, logger)
         
     except KeyboardInterrupt:
         print("\r" + " " * 80 + "\r", end="", flush=True)
@@ -793,4 +3610,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # 打包为可执行文件后多进程模式需要
+    multiprocessing.freeze_support()
     main()